@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List
+
+import metrics
+
+# Lower value is served first
+PRIORITIES = {"crisis": 0, "normal": 1}
+
+class AdmissionRejected(RuntimeError):
+    """The queue is full or the wait ran out; the caller should answer without the model."""
+
+class AdmissionController:
+    """Bounded concurrency in front of a slow shared resource. Callers beyond
+    `max_concurrent` wait in a priority queue (crisis first, then arrival
+    order); normal callers are turned away at once when `max_queue` are
+    already waiting, crisis callers always get a place in the queue."""
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait_s: float = 0, name: str = "admission"):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max_wait_s  # 0 waits as long as it takes
+        self.name = name
+        self._active = 0
+        self._waiting: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, priority: str = "normal"):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _depth(self) -> int:
+        return sum(not entry[2].done() for entry in self._waiting)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge(f"{self.name}.in_flight", self._active)
+        metrics.set_gauge(f"{self.name}.queue_depth", self._depth())
+
+    async def _acquire(self, priority: str) -> None:
+        rank = PRIORITIES[priority]
+        t0 = time.perf_counter()
+        if self._active < self.max_concurrent and not self._depth():
+            self._active += 1
+            self._admitted(priority, t0)
+            return
+
+        if priority != "crisis" and self._depth() >= self.max_queue:
+            metrics.incr(f"{self.name}.rejected.queue_full")
+            raise AdmissionRejected(f"{self.name}: {self._depth()} callers already waiting")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, [rank, next(self._seq), fut])
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(fut, self.max_wait_s or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release()
+            self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.incr(f"{self.name}.rejected.timeout")
+                raise AdmissionRejected(f"{self.name}: waited {self.max_wait_s:.0f}s without a free slot") from None
+            raise
+        self._admitted(priority, t0)
+
+    def _admitted(self, priority: str, t0: float) -> None:
+        wait_ms = (time.perf_counter() - t0) * 1000
+        metrics.incr(f"{self.name}.admitted.{priority}")
+        metrics.observe(f"{self.name}.wait_ms.{priority}", wait_ms)
+        self._update_gauges()
+
+    def _release(self) -> None:
+        self._active -= 1
+        # Hand the slot straight to the best waiter so no newcomer can jump the queue
+        while self._waiting:
+            _, _, fut = heapq.heappop(self._waiting)
+            if not fut.done():
+                self._active += 1
+                fut.set_result(None)
+                break
+        self._update_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._active,
+            "queue_depth": self._depth(),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            **metrics.snapshot(f"{self.name}."),
+        }
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------- Durable outbox for crisis and misuse alerts ---------------
+ALERT_OUTBOX_PATH = os.getenv("ALERT_OUTBOX_PATH", os.path.join("logs", "alert_outbox.sqlite"))
+ALERT_OUTBOX_BATCH = int(os.getenv("ALERT_OUTBOX_BATCH", "50"))
+ALERT_OUTBOX_POLL_S = float(os.getenv("ALERT_OUTBOX_POLL_S", "5"))
+ALERT_OUTBOX_MAX_BACKOFF_S = float(os.getenv("ALERT_OUTBOX_MAX_BACKOFF_S", "300"))
+# An alert Postgres rejects this many times on its own (bad data, not an outage) is dead-lettered
+ALERT_OUTBOX_MAX_REJECTIONS = int(os.getenv("ALERT_OUTBOX_MAX_REJECTIONS", "3"))
+# SQLSTATE classes that are about the row itself: 22 data exception, 23 integrity constraint violation
+ROW_ERROR_CLASSES = ("22", "23")
+
+# Outbox kind -> statement in db.STATEMENTS; every statement takes the idempotency key first
+# and ignores a key it has already stored, so a redelivery after a lost ack inserts nothing
+KINDS = {
+    "crisis_alert": ("insert_crisis_alert", ("severity_level", "description", "created_at")),
+    "misuse_flag": ("insert_misuse_flag", ("report_reason",)),
+}
+
+class AlertOutbox:
+    """Alerts are committed to a local SQLite log (WAL) before the tool
+    returns; a background task batch-inserts them into Postgres, retrying
+    with backoff until each one is delivered. A batch that fails is retried
+    row by row, so one alert Postgres keeps rejecting is dead-lettered instead
+    of holding back the rest."""
+
+    def __init__(self, path: str = ALERT_OUTBOX_PATH, batch_size: int = ALERT_OUTBOX_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL: an alert the tool reported as sent must survive a power cut
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " idempotency_key TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " delivered_at REAL,"
+            " last_error TEXT,"
+            " rejections INTEGER NOT NULL DEFAULT 0,"
+            " dead_at REAL)"
+        )
+        # Outbox files written before dead-lettering existed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "rejections" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0")
+        if "dead_at" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN dead_at REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (next_attempt_at) WHERE delivered_at IS NULL")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._wake: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    # ---- Producer side ----
+    def enqueue(self, kind: str, payload: Dict[str, Any], idempotency_key: str | None = None) -> str:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown alert kind '{kind}', expected one of {list(KINDS)}")
+        key = idempotency_key or str(uuid.uuid4())
+        now = time.time()
+        payload = {"created_at": now, **payload}
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, kind, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), now, now),
+            ).rowcount
+            self._db.commit()
+        metrics.incr(f"outbox.enqueued.{kind}" if inserted else "outbox.duplicates")
+        if self._wake is not None:
+            self._wake.set()
+        return key
+
+    # ---- Delivery ----
+    def _due(self) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, idempotency_key, kind, payload, created_at, attempts FROM outbox"
+                " WHERE delivered_at IS NULL AND dead_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size),
+            ).fetchall()
+
+    def _mark_delivered(self, rows: List[tuple]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.executemany("UPDATE outbox SET delivered_at = ?, last_error = NULL WHERE id = ?", [(now, r[0]) for r in rows])
+            self._db.commit()
+        for row in rows:
+            metrics.observe("outbox.delivery_ms", (now - row[4]) * 1000)
+        metrics.incr("outbox.delivered", len(rows))
+
+    def _mark_failed(self, rows: List[tuple], error: Exception) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                [(now + min(2 ** r[5], ALERT_OUTBOX_MAX_BACKOFF_S), f"{type(error).__name__}: {error}"[:500], r[0]) for r in rows],
+            )
+            self._db.commit()
+        metrics.incr("outbox.failed_attempts", len(rows))
+
+    def _mark_rejected(self, row: tuple, error: Exception) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, rejections = rejections + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (now + min(2 ** row[5], ALERT_OUTBOX_MAX_BACKOFF_S), f"{type(error).__name__}: {error}"[:500], row[0]),
+            )
+            rejections = self._db.execute("SELECT rejections FROM outbox WHERE id = ?", (row[0],)).fetchone()[0]
+            if rejections >= ALERT_OUTBOX_MAX_REJECTIONS:
+                self._db.execute("UPDATE outbox SET dead_at = ? WHERE id = ?", (now, row[0]))
+            self._db.commit()
+        metrics.incr("outbox.failed_attempts")
+        if rejections >= ALERT_OUTBOX_MAX_REJECTIONS:
+            metrics.incr("outbox.dead_letters")
+            logger.error("Outbox %s %s dead-lettered after %d rejections: %s", row[2], row[1], rejections, error)
+
+    @staticmethod
+    def _row_error(error: Exception) -> bool:
+        # Postgres rejected this row's values; anything else (outage, timeout, schema) affects every row
+        return str(getattr(error, "sqlstate", "") or "")[:2] in ROW_ERROR_CLASSES
+
+    async def _deliver_rows(self, db, statement: str, batch: List[tuple], args: List[tuple]) -> int:
+        # Isolates the row(s) that broke a batch; stops at the first error that is not about the row
+        delivered = 0
+        for i, (row, arg) in enumerate(zip(batch, args)):
+            try:
+                await db.execute(statement, *arg)
+            except Exception as e:
+                if not self._row_error(e):
+                    self._mark_failed(batch[i:], e)
+                    break
+                self._mark_rejected(row, e)
+                continue
+            self._mark_delivered([row])
+            delivered += 1
+        return delivered
+
+    async def deliver_once(self, db) -> int:
+        rows = self._due()
+        delivered = 0
+        for kind, (statement, fields) in KINDS.items():
+            batch = [r for r in rows if r[2] == kind]
+            if not batch:
+                continue
+            args = []
+            for r in batch:
+                payload = json.loads(r[3])
+                args.append((r[1], *(payload.get(f) for f in fields)))
+            try:
+                # asyncpg's executemany is atomic: the whole batch lands or none of it
+                await db.executemany(statement, args)
+            except Exception as e:
+                logger.warning("Outbox delivery of %d %s failed: %s", len(batch), kind, e)
+                if self._row_error(e):
+                    delivered += await self._deliver_rows(db, statement, batch, args)
+                else:
+                    self._mark_failed(batch, e)
+                continue
+            self._mark_delivered(batch)
+            delivered += len(batch)
+        self._update_gauges()
+        return delivered
+
+    async def run(self, db) -> None:
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                delivered = await self.deliver_once(db)
+            except Exception:
+                logger.exception("Outbox worker error")
+                delivered = 0
+            if delivered >= self.batch_size:
+                continue  # more may be waiting
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), ALERT_OUTBOX_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, db) -> None:
+        # Once per process, inside the running event loop
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self.run(db))
+
+    # ---- Reporting ----
+    def _update_gauges(self) -> None:
+        pending, oldest = self._pending()
+        metrics.set_gauge("outbox.pending", pending)
+        metrics.set_gauge("outbox.lag_s", time.time() - oldest if oldest else 0.0)
+
+    def _pending(self) -> tuple:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*), MIN(created_at) FROM outbox WHERE delivered_at IS NULL AND dead_at IS NULL").fetchone()
+
+    def stats(self) -> Dict[str, Any]:
+        pending, oldest = self._pending()
+        with self._lock:
+            last_error = self._db.execute(
+                "SELECT last_error FROM outbox WHERE delivered_at IS NULL AND last_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            dead = self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead_at IS NOT NULL").fetchone()[0]
+        return {
+            "pending": pending,
+            "dead_letters": dead,
+            "lag_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "worker_running": self._worker is not None and not self._worker.done(),
+            "last_error": last_error[0] if last_error else None,
+            **metrics.snapshot("outbox."),
+        }
+
+# Shared by the MCP server's alert tools
+alert_outbox = AlertOutbox()
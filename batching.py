@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Collects requests from many callers for a few milliseconds, groups them
+    by key and runs `process_batch(key, items)` once per group on a single
+    worker thread. Every caller gets back its own result (or exception)."""
+
+    def __init__(
+        self,
+        process_batch: Callable[[Hashable, List[Any]], List[Any]],
+        key_fn: Optional[Callable[[Any], Hashable]] = None,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher",
+    ):
+        self.process_batch = process_batch
+        self.key_fn = key_fn or (lambda item: None)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    # ---- Caller side ----
+    def submit(self, item: Any) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((item, fut, time.perf_counter()))
+        metrics.set_gauge(f"{self.name}.queue_depth", self._queue.qsize())
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    async def asubmit(self, item: Any) -> Any:
+        # Never blocks the event loop: the worker thread resolves the future
+        return await asyncio.wrap_future(self.submit(item))
+
+    # ---- Worker side ----
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        pending = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Drain whatever else is already waiting so it can join a group
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            groups: Dict[Hashable, List[Tuple[Any, Future, float]]] = {}
+            for entry in pending:
+                try:
+                    key = self.key_fn(entry[0])
+                except Exception as e:
+                    entry[1].set_exception(e)
+                    continue
+                groups.setdefault(key, []).append(entry)
+
+            for key, entries in groups.items():
+                for i in range(0, len(entries), self.max_batch_size):
+                    self._process(key, entries[i:i + self.max_batch_size])
+
+    def _process(self, key: Hashable, entries: List[Tuple[Any, Future, float]]):
+        now = time.perf_counter()
+        for _, _, enqueued in entries:
+            metrics.observe(f"{self.name}.queue_wait_ms", (now - enqueued) * 1000)
+        metrics.observe(f"{self.name}.batch_size", len(entries))
+        metrics.incr(f"{self.name}.batches")
+
+        try:
+            with metrics.timer(f"{self.name}.batch_ms"):
+                results = self.process_batch(key, [item for item, _, _ in entries])
+            if len(results) != len(entries):
+                raise RuntimeError(f"{self.name}: got {len(results)} results for {len(entries)} items")
+        except Exception as e:
+            logger.exception("%s: batch for key %r failed", self.name, key)
+            for _, fut, _ in entries:
+                fut.set_exception(e)
+            return
+
+        for (_, fut, _), result in zip(entries, results):
+            fut.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return metrics.snapshot(prefix=f"{self.name}.")
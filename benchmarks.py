@@ -0,0 +1,255 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+def load_log_inputs(log_dir: str = "logs") -> list[dict]:
+    # Turns recorded by AuditLogger: raw student input plus the gateway output
+    records = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "audit_*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+def english_inputs(log_dir: str = "logs") -> list[str]:
+    return [r["raw_user_input"] for r in load_log_inputs(log_dir) if r["raw_user_input"].isascii()]
+
+def time_calls(fn, inputs, repeat: int = 3) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        for item in inputs:
+            t0 = time.perf_counter()
+            fn(item)
+            timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+def summarize(name: str, timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "name": name,
+        "calls": len(timings),
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+    }
+
+# --------------- PII label cache ---------------
+def bench_pii_labels(args):
+    from pii_engine import PIIEngine, PII_LABELS
+
+    texts = english_inputs(args.log_dir)
+    model_name = os.getenv("PII_REMOVAL_MODEL")
+    threshold = float(os.getenv("PII_REMOVAL_THRESHOLD", "0.5"))
+
+    cached = PIIEngine(model_name, threshold, registry_key="bench_gliner", use_label_cache=True)
+    uncached = PIIEngine(model_name, threshold, registry_key="bench_gliner", use_label_cache=False)
+    model_labels = cached.split_labels(PII_LABELS)[1]
+    if not cached.precompute_labels(model_labels):
+        print(f"{model_name} is a uni-encoder checkpoint: labels are encoded jointly with the text, nothing to cache")
+
+    # Warm both paths once so model load is not counted
+    cached.model_predict_batch(texts[:1], model_labels)
+    uncached.model_predict_batch(texts[:1], model_labels)
+
+    results = [
+        summarize("uncached_labels", time_calls(lambda t: uncached.model_predict_batch([t], model_labels), texts, args.repeat)),
+        summarize("cached_labels", time_calls(lambda t: cached.model_predict_batch([t], model_labels), texts, args.repeat)),
+    ]
+    results.append({"saving_per_call_ms": round(results[0]["mean_ms"] - results[1]["mean_ms"], 2)})
+    return results
+
+# --------------- Emotion on source text ---------------
+def logged_emotions(record: dict) -> list[str]:
+    # The "Emotions:" block pre_processing wrote into the prompt, if the turn went through it
+    block = record.get("preprocessed_input", "").split("Emotions:", 1)
+    return [line.strip() for line in block[1].splitlines() if line.strip()] if len(block) == 2 else []
+
+def bench_emotion_source(args):
+    import privacy_gateway as pg
+    from translation_engine import translate_batch
+
+    records = [r for r in load_log_inputs(args.log_dir) if not r["raw_user_input"].isascii()]
+    serial_ms, parallel_ms, top1, jaccard = [], [], [], []
+
+    for record in records:
+        text = record["raw_user_input"]
+
+        t0 = time.perf_counter()
+        # translate_batch skips the segment cache, so both paths pay for a real translation
+        english = translate_batch([text], "indic_en", args.src_lang, "eng_Latn")[0]
+        serial = [label for label, _ in pg.emotion_engine.classify(english)]
+        serial_ms.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        pending = pg.source_emotion_engine.batcher.submit(text)
+        translate_batch([text], "indic_en", args.src_lang, "eng_Latn")
+        source = [label for label, _ in pending.result()]
+        parallel_ms.append((time.perf_counter() - t0) * 1000)
+
+        # Logged labels came from the serial path in production; fall back to this run's serial output
+        reference = logged_emotions(record) or serial
+        top1.append(bool(source) and bool(reference) and source[0] == reference[0])
+        union = set(source) | set(reference)
+        jaccard.append(len(set(source) & set(reference)) / len(union) if union else 1.0)
+
+    return [
+        summarize("serial_translate_then_classify", serial_ms),
+        summarize("parallel_source_classify", parallel_ms),
+        {"inputs": len(records), "top1_agreement": round(sum(top1) / len(top1), 3),
+         "mean_jaccard": round(statistics.mean(jaccard), 3)},
+    ]
+
+# --------------- CPU backends vs fp32 ---------------
+def bench_backend_parity(args):
+    from emotion_engine import EmotionEngine
+    from inference_backends import emotion_parity, pii_parity
+    from pii_engine import PIIEngine, PII_LABELS
+
+    texts = english_inputs(args.log_dir)
+    rows = []
+
+    emotion_kwargs = dict(
+        model_name=os.getenv("EMOTION_MODEL"),
+        device="cpu",
+        threshold=float(os.getenv("THRESHOLD_FOR_EMOTION", "0.3")),
+        temperature=float(os.getenv("TEMPERATURE_FOR_EMOTION", "1.0")),
+        top_n=int(os.getenv("TOP_N_EMOTION", "5")),
+    )
+    reference = EmotionEngine(**emotion_kwargs, registry_key="emotion_fp32")
+    candidate = EmotionEngine(**emotion_kwargs, registry_key=f"emotion_{args.backend}", backend=args.backend)
+    rows.append({"model": "emotion", "backend": args.backend, **emotion_parity(reference, candidate, texts)})
+    rows.append(summarize("emotion_fp32", time_calls(lambda t: reference.probabilities([t]), texts, args.repeat)))
+    rows.append(summarize(f"emotion_{args.backend}", time_calls(lambda t: candidate.probabilities([t]), texts, args.repeat)))
+
+    pii_kwargs = dict(model_name=os.getenv("PII_REMOVAL_MODEL"), threshold=float(os.getenv("PII_REMOVAL_THRESHOLD", "0.5")))
+    reference = PIIEngine(**pii_kwargs, registry_key="gliner_fp32")
+    candidate = PIIEngine(**pii_kwargs, registry_key=f"gliner_{args.backend}", backend=args.backend)
+    model_labels = reference.split_labels(PII_LABELS)[1]
+    rows.append({"model": "gliner", "backend": args.backend, **pii_parity(reference, candidate, texts, model_labels)})
+    rows.append(summarize("gliner_fp32", time_calls(lambda t: reference.model_predict_batch([t], model_labels), texts, args.repeat)))
+    rows.append(summarize(f"gliner_{args.backend}", time_calls(lambda t: candidate.model_predict_batch([t], model_labels), texts, args.repeat)))
+    return rows
+
+# --------------- Translation backends ---------------
+def corpus_bleu(hypotheses: list[str], references: list[str], max_n: int = 4) -> float:
+    # Plain corpus BLEU on whitespace tokens, enough to spot drift between backends
+    import math
+    from collections import Counter
+
+    matches, totals = [0] * max_n, [0] * max_n
+    hyp_len = ref_len = 0
+    for hyp, ref in zip(hypotheses, references):
+        hyp_tokens, ref_tokens = hyp.split(), ref.split()
+        hyp_len += len(hyp_tokens)
+        ref_len += len(ref_tokens)
+        for n in range(1, max_n + 1):
+            hyp_ngrams = Counter(tuple(hyp_tokens[i:i + n]) for i in range(len(hyp_tokens) - n + 1))
+            ref_ngrams = Counter(tuple(ref_tokens[i:i + n]) for i in range(len(ref_tokens) - n + 1))
+            matches[n - 1] += sum((hyp_ngrams & ref_ngrams).values())
+            totals[n - 1] += max(len(hyp_tokens) - n + 1, 0)
+    if not hyp_len or min(matches) == 0:
+        return 0.0
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / max_n
+    brevity = 1.0 if hyp_len > ref_len else math.exp(1 - ref_len / hyp_len)
+    return round(100 * brevity * math.exp(log_precision), 2)
+
+def default_reference_backend() -> str:
+    # fp16 needs CUDA (flash attention); on CPU-only hosts compare against fp32 on CPU
+    import torch
+    return "fp16" if torch.cuda.is_available() else "cpu-fp32"
+
+def bench_translation_backend(args):
+    from translation_engine import translate_batch
+
+    reference = args.reference_backend or default_reference_backend()
+    records = load_log_inputs(args.log_dir)
+    cases = [
+        ("indic_en", args.src_lang, "eng_Latn", [r["raw_user_input"] for r in records if not r["raw_user_input"].isascii()]),
+        ("en_indic", "eng_Latn", args.src_lang, english_inputs(args.log_dir)),
+    ]
+
+    rows = []
+    for direction, src_lang, tgt_lang, texts in cases:
+        if not texts:
+            continue
+        outputs = {}
+        for backend in dict.fromkeys((reference, args.translation_backend)):
+            translate_batch(texts[:1], direction, src_lang, tgt_lang, backend)  # load + warm up
+            t0 = time.perf_counter()
+            outputs[backend] = [translate_batch([t], direction, src_lang, tgt_lang, backend)[0] for t in texts]
+            elapsed = time.perf_counter() - t0
+            rows.append({"direction": direction, "backend": backend, "sentences": len(texts),
+                         "sentences_per_sec": round(len(texts) / elapsed, 2)})
+        rows.append({"direction": direction, "backend": args.translation_backend, "reference": reference,
+                     "bleu_vs_reference": corpus_bleu(outputs[args.translation_backend], outputs[reference])})
+    return rows
+
+# --------------- Gateway import time ---------------
+HEAVY_MODULES = ("torch", "transformers", "gliner", "IndicTransToolkit", "onnxruntime")
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import privacy_gateway
+import_ms = (time.perf_counter() - t0) * 1000
+heavy = [m for m in json.loads(sys.argv[1]) if m in sys.modules]
+warmup_ms = privacy_gateway.warmup() if sys.argv[2] == "1" else None
+print(json.dumps({"import_ms": import_ms, "heavy_modules": heavy, "warmup_ms": warmup_ms}))
+"""
+
+def bench_import_time(args):
+    # A fresh interpreter per run, so nothing is already cached in sys.modules
+    import subprocess
+    import sys
+
+    runs = []
+    for i in range(args.repeat):
+        warm = args.warmup and i == 0
+        out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE, json.dumps(HEAVY_MODULES), "1" if warm else "0"],
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    row = summarize("import_privacy_gateway", [r["import_ms"] for r in runs])
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+    row["heavy_modules"] = heavy
+    row["ok"] = not heavy and (args.max_import_ms <= 0 or row["p50_ms"] <= args.max_import_ms)
+    rows = [row]
+    if runs[0]["warmup_ms"] is not None:
+        rows.append({"name": "warmup", **runs[0]["warmup_ms"]})
+    return rows
+
+BENCHMARKS = {
+    "pii-labels": bench_pii_labels,
+    "emotion-source": bench_emotion_source,
+    "backend-parity": bench_backend_parity,
+    "translation-backend": bench_translation_backend,
+    "import-time": bench_import_time,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency benchmarks for the privacy gateway (CPU by default)")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--log-dir", default="logs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default="int8", help="backend compared against fp32 torch in backend-parity")
+    parser.add_argument("--translation-backend", default="cpu-int8", help="backend measured in translation-backend")
+    parser.add_argument("--reference-backend", choices=("fp16", "cpu-fp32", "cpu-int8"),
+                        help="translation-backend reference for speed and BLEU (default fp16 with CUDA, else cpu-fp32)")
+    parser.add_argument("--src-lang", default="tam_Taml", help="language of the non-English turns in the logs")
+    parser.add_argument("--max-import-ms", type=float, default=0, help="import-time fails above this median (0 = no limit)")
+    parser.add_argument("--warmup", action="store_true", help="import-time also times privacy_gateway.warmup() once")
+    args = parser.parse_args()
+
+    rows = BENCHMARKS[args.benchmark](args)
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    # Rows that carry a verdict make the run usable as a regression check
+    if any(row.get("ok") is False for row in rows):
+        raise SystemExit(1)
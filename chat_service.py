@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import uuid
+import weakref
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from mcp_client_remote import LANGUAGES, USE_PRIVACY_GATEWAY, build_agent, run_turn, streams_draft
+from privacy_gateway import model_stats, pii_stats, translation_stats, warmup
+
+logger = logging.getLogger(__name__)
+
+# --------------- Long-lived chat service ---------------
+# One process builds the agent, MCP tools and gateway models once and serves
+# every /chat request; server/index.js POSTs here instead of spawning Python
+CHAT_SERVICE_HOST = os.getenv("CHAT_SERVICE_HOST", "127.0.0.1")
+CHAT_SERVICE_PORT = int(os.getenv("CHAT_SERVICE_PORT", "8100"))
+CHAT_MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "4000"))
+
+# Turns of one session run one at a time so they reach the checkpointer in order;
+# a lock lives only while some request of that session holds or waits on it
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_in_flight = 0
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[session_id] = lock
+    return lock
+
+def _error(message: str, status: int) -> JSONResponse:
+    metrics.incr(f"chat.errors.{status}")
+    return JSONResponse({"error": message}, status_code=status)
+
+async def _parse_chat(request: Request):
+    # Returns (message, language, session_id) or an error response
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error("Body must be JSON", 400)
+    if not isinstance(body, dict):
+        return _error("Body must be a JSON object", 400)
+
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return _error("Message is required", 400)
+    if len(message) > CHAT_MAX_MESSAGE_CHARS:
+        return _error(f"Message is longer than {CHAT_MAX_MESSAGE_CHARS} characters", 413)
+
+    # Accepts FLORES codes ("tam_Taml") or the names the frontend shows ("Tamil")
+    language = body.get("language") or "eng_Latn"
+    if not isinstance(language, str):
+        return _error("Language must be a string", 400)
+    language = LANGUAGES.get(language, language)
+    if language not in LANGUAGES.values():
+        return _error(f"Unknown language '{language}'", 400)
+
+    # The session id is the agent's checkpoint thread_id, so a session keeps its history
+    session_id = str(body.get("session_id") or uuid.uuid4())
+    return message, language, session_id
+
+async def _serve_turn(request: Request, message: str, language: str, session_id: str, on_token=None) -> dict:
+    global _in_flight
+    metrics.incr("chat.requests")
+    _in_flight += 1
+    metrics.set_gauge("chat.in_flight", _in_flight)
+    try:
+        async with session_lock(session_id):
+            with metrics.timer("chat.turn_ms"):
+                return await run_turn(request.app.state.agent, message, session_id, language, on_token=on_token)
+    finally:
+        _in_flight -= 1
+        metrics.set_gauge("chat.in_flight", _in_flight)
+
+async def chat(request: Request) -> JSONResponse:
+    parsed = await _parse_chat(request)
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    message, language, session_id = parsed
+
+    try:
+        result = await _serve_turn(request, message, language, session_id)
+    except Exception:
+        logger.exception("Chat turn failed (session %s)", session_id)
+        return _error("Failed to get AI response", 500)
+
+    return JSONResponse(result)
+
+async def chat_stream(request: Request):
+    """Same input as /chat; answers with NDJSON lines: {"type": "token"} while the
+    medical bot generates, then one {"type": "done"} (or "error") with the reply.
+    Tokens are the bot's English draft, so they are only sent when the reply is
+    not translated afterwards; otherwise the stream carries just the final line."""
+    parsed = await _parse_chat(request)
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    message, language, session_id = parsed
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def on_token(token: str) -> None:
+        await events.put({"type": "token", "text": token})
+
+    translated = not streams_draft(language)
+    if translated:
+        metrics.incr("chat.stream.tokens_suppressed")
+
+    async def turn():
+        try:
+            result = await _serve_turn(request, message, language, session_id, on_token=None if translated else on_token)
+            await events.put({"type": "done", **result})
+        except Exception:
+            logger.exception("Chat turn failed (session %s)", session_id)
+            metrics.incr("chat.errors.500")
+            await events.put({"type": "error", "error": "Failed to get AI response", "session_id": session_id})
+
+    async def lines():
+        # If the client goes away the turn still finishes, so its history and any alerts are kept
+        request.app.state.turns.add(task := asyncio.create_task(turn()))
+        task.add_done_callback(request.app.state.turns.discard)
+        while True:
+            event = await events.get()
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+            if event["type"] != "token":
+                break
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def health(request: Request) -> JSONResponse:
+    ready = getattr(request.app.state, "agent", None) is not None
+    return JSONResponse({"status": "ok" if ready else "starting"}, status_code=200 if ready else 503)
+
+async def stats(request: Request) -> JSONResponse:
+    return JSONResponse({
+        "chat": metrics.snapshot("chat."),
+        "models": model_stats(),
+        "translation": translation_stats(),
+        "pii": pii_stats(),
+    })
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    if USE_PRIVACY_GATEWAY:
+        # Model loads block, keep them off the event loop
+        logger.info("Gateway warm-up: %s", await asyncio.to_thread(warmup))
+    app.state.agent = await build_agent()
+    app.state.turns = set()
+    logger.info("Chat service ready")
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=CHAT_SERVICE_HOST, port=CHAT_SERVICE_PORT)
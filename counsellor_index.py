@@ -0,0 +1,376 @@
+import asyncio
+import bisect
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+from zoneinfo import ZoneInfo
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------- Counsellor availability index ---------------
+COUNSELLOR_INDEX_TTL_S = float(os.getenv("COUNSELLOR_INDEX_TTL_S", "60"))
+# Incremental refreshes only see rows whose updated_at moved or that were notified;
+# a periodic full reload also picks up everything else (e.g. a renamed user)
+COUNSELLOR_INDEX_FULL_RELOAD_S = float(os.getenv("COUNSELLOR_INDEX_FULL_RELOAD_S", "900"))
+# Schedules are written in the counsellors' local time
+COUNSELLOR_TIMEZONE = os.getenv("COUNSELLOR_TIMEZONE", "Asia/Kolkata")
+# Postgres channel a trigger on counselor_profiles notifies (see Workings/db_command.txt)
+COUNSELLOR_NOTIFY_CHANNEL = os.getenv("COUNSELLOR_NOTIFY_CHANNEL", "counselor_profiles_changed")
+# Longest wait between attempts to re-establish a dropped LISTEN connection
+COUNSELLOR_LISTEN_RETRY_MAX_S = float(os.getenv("COUNSELLOR_LISTEN_RETRY_MAX_S", "60"))
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+DAY = 24 * 60
+WEEK = 7 * DAY
+
+# "09:00-12:00", "9-12", "9am - 1:30pm", "21:00-02:00" (runs past midnight)
+_RANGE = re.compile(
+    r"(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?\s*(?:-|–|to)\s*(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?",
+    re.IGNORECASE,
+)
+
+def _minutes(hour: str, minute: str | None, meridiem: str | None) -> int:
+    h, m = int(hour), int(minute or 0)
+    if meridiem:
+        pm = meridiem.lower().startswith("p")
+        h = h % 12 + (12 if pm else 0)
+    return h * 60 + m
+
+def parse_day(text: str) -> List[tuple]:
+    """Ranges of one weekday as (start, end) minutes after midnight; "Off" or
+    anything unparseable gives no ranges. An end before the start runs past midnight."""
+    ranges = []
+    for match in _RANGE.finditer(text or ""):
+        h1, m1, ap1, h2, m2, ap2 = match.groups()
+        end = _minutes(h2, m2, ap2)
+        start = _minutes(h1, m1, ap1)
+        if not ap1 and ap2 and int(h1) <= 12:
+            # "1-5pm" is 13:00-17:00, but "9-1pm" is 09:00-13:00 and "10-2am" is 22:00-02:00:
+            # the start takes the end's meridiem only if that keeps it before the end
+            start = _minutes(h1, m1, ap2)
+            if start >= end:
+                start = _minutes(h1, m1, "am" if ap2.lower().startswith("p") else "pm")
+        if start > DAY or end > DAY:
+            continue
+        if end <= start:
+            end += DAY
+        ranges.append((start, end))
+    return ranges
+
+def parse_schedule(schedule: Any) -> List[tuple]:
+    """availability_schedule JSONB (weekday -> "09:00-12:00, 14:00-17:00") as
+    sorted, merged (start, end) minutes from Monday 00:00."""
+    if isinstance(schedule, str):
+        schedule = json.loads(schedule or "{}")
+    intervals = []
+    for day, text in (schedule or {}).items():
+        day = str(day).strip().lower()
+        if day not in WEEKDAYS:
+            metrics.incr("counsellor_index.unknown_weekday")
+            continue
+        offset = WEEKDAYS.index(day) * DAY
+        for start, end in parse_day(str(text)):
+            start, end = offset + start, offset + end
+            if end > WEEK:
+                # Sunday night into Monday morning
+                intervals.append((0, end - WEEK))
+                end = WEEK
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def week_minute(moment: datetime.datetime) -> int:
+    return moment.weekday() * DAY + moment.hour * 60 + moment.minute
+
+def format_week_minute(minute: int) -> str:
+    minute %= WEEK
+    return f"{WEEKDAYS[minute // DAY].capitalize()} {minute % DAY // 60:02d}:{minute % 60:02d}"
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+class CounsellorIndex:
+    """Counsellor schedules parsed once into weekly intervals, with inverted
+    indexes on spoken language and specialization words, so "who is free now /
+    next, speaks Tamil, does anxiety" never touches the database."""
+
+    def __init__(self, ttl_s: float = COUNSELLOR_INDEX_TTL_S, timezone: str = COUNSELLOR_TIMEZONE,
+                 full_reload_s: float = COUNSELLOR_INDEX_FULL_RELOAD_S):
+        self.ttl_s = ttl_s
+        self.full_reload_s = full_reload_s
+        self.tz = ZoneInfo(timezone)
+        self._counsellors: Dict[str, Dict[str, Any]] = {}
+        self._by_language: Dict[str, set] = {}
+        self._by_specialization: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._loaded_at: float | None = None
+        self._high_water = None  # newest updated_at seen, for incremental refreshes
+        self._full_at: float | None = None
+        self._changed_ids: set = set()  # ids from change notifications, re-fetched on the next refresh
+        self._stale = True
+        self._refresh_lock: asyncio.Lock | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._listener = None
+        self._listen_args: tuple | None = None  # (url, ssl) once listen() was called
+        self._reconnect_task: asyncio.Task | None = None
+
+    # ---- Building ----
+    @staticmethod
+    def _record(row: Dict[str, Any]) -> Dict[str, Any]:
+        intervals = parse_schedule(row.get("availability_schedule"))
+        languages = [l for l in (row.get("languages_spoken") or []) if l]
+        specializations = [s for s in (row.get("specialization") or []) if s]
+        return {
+            "id": str(row["id"]),
+            "name": f"{row.get('first_name') or ''} {row.get('last_name') or ''}".strip(),
+            "languages": languages,
+            "specializations": specializations,
+            "intervals": intervals,
+            "starts": [start for start, _ in intervals],
+            "online": row.get("current_availability"),
+        }
+
+    def _unindex(self, counsellor_id: str) -> None:
+        old = self._counsellors.pop(counsellor_id, None)
+        if old is None:
+            return
+        for key in old["_language_keys"]:
+            self._by_language.get(key, set()).discard(counsellor_id)
+        for key in old["_specialization_keys"]:
+            self._by_specialization.get(key, set()).discard(counsellor_id)
+
+    def _index(self, record: Dict[str, Any]) -> None:
+        self._unindex(record["id"])
+        record["_language_keys"] = {l.strip().lower() for l in record["languages"]}
+        record["_specialization_keys"] = {t for s in record["specializations"] for t in _tokens(s)}
+        for key in record["_language_keys"]:
+            self._by_language.setdefault(key, set()).add(record["id"])
+        for key in record["_specialization_keys"]:
+            self._by_specialization.setdefault(key, set()).add(record["id"])
+        self._counsellors[record["id"]] = record
+
+    def load(self, rows: Iterable[Dict[str, Any]], full: bool = True) -> int:
+        """Indexes rows; `full` replaces everything, otherwise rows are upserted."""
+        rows = [dict(row) for row in rows]
+        records = [self._record(row) for row in rows]
+        with self._lock:
+            if full:
+                self._counsellors.clear()
+                self._by_language.clear()
+                self._by_specialization.clear()
+            for record in records:
+                self._index(record)
+            for row in rows:
+                updated = row.get("updated_at")
+                if updated is not None and (self._high_water is None or updated > self._high_water):
+                    self._high_water = updated
+            self._loaded_at = time.monotonic()
+            metrics.set_gauge("counsellor_index.counsellors", len(self._counsellors))
+        return len(records)
+
+    def retain(self, ids: Iterable[str]) -> int:
+        # Drops counsellors whose profile was deleted
+        keep = {str(i) for i in ids}
+        with self._lock:
+            gone = [cid for cid in self._counsellors if cid not in keep]
+            for cid in gone:
+                self._unindex(cid)
+            metrics.set_gauge("counsellor_index.counsellors", len(self._counsellors))
+        return len(gone)
+
+    # ---- Queries ----
+    def _candidates(self, language: str | None, specialization: str | None) -> Iterable[Dict[str, Any]]:
+        ids = None
+        if language:
+            # "Tamil", "tamil" or "Kashmiri (Arabic)" all match a profile listing "Tamil" / "Kashmiri"
+            key = language.split("(")[0].strip().lower()
+            ids = set(self._by_language.get(key, ()))
+        if specialization:
+            for token in _tokens(specialization):
+                matches = self._by_specialization.get(token, set())
+                ids = set(matches) if ids is None else ids & matches
+        if ids is None:
+            return list(self._counsellors.values())
+        return [self._counsellors[i] for i in ids]
+
+    def _now(self, now: datetime.datetime | None) -> int:
+        now = now or datetime.datetime.now(self.tz)
+        if now.tzinfo is not None:
+            now = now.astimezone(self.tz)
+        return week_minute(now)
+
+    def available_now(self, language: str | None = None, specialization: str | None = None,
+                      now: datetime.datetime | None = None) -> List[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        minute = self._now(now)
+        found = []
+        with self._lock:
+            for c in self._candidates(language, specialization):
+                i = bisect.bisect_right(c["starts"], minute) - 1
+                if i >= 0 and c["intervals"][i][1] > minute:
+                    found.append({**self._public(c), "until": format_week_minute(c["intervals"][i][1])})
+        metrics.observe("counsellor_index.query_ms", (time.perf_counter() - t0) * 1000)
+        return sorted(found, key=lambda c: c["name"])
+
+    def next_available(self, language: str | None = None, specialization: str | None = None,
+                       now: datetime.datetime | None = None, limit: int = 3) -> List[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        minute = self._now(now)
+        found = []
+        with self._lock:
+            for c in self._candidates(language, specialization):
+                if not c["starts"]:
+                    continue
+                i = bisect.bisect_right(c["starts"], minute)
+                start = c["starts"][i] if i < len(c["starts"]) else c["starts"][0] + WEEK
+                found.append((start - minute, {**self._public(c), "from": format_week_minute(start)}))
+        metrics.observe("counsellor_index.query_ms", (time.perf_counter() - t0) * 1000)
+        found.sort(key=lambda pair: pair[0])
+        return [c for _, c in found[:limit]]
+
+    @staticmethod
+    def _public(c: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": c["id"], "name": c["name"], "languages": c["languages"],
+                "specializations": c["specializations"], "online": c["online"]}
+
+    # ---- Refreshing from Postgres ----
+    @property
+    def full_due(self) -> bool:
+        return self._full_at is None or time.monotonic() - self._full_at > self.full_reload_s
+
+    @property
+    def due(self) -> bool:
+        return self._stale or self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s or self.full_due
+
+    def mark_stale(self, *args) -> None:
+        # Also the LISTEN callback: (connection, pid, channel, payload), the payload being the profile id
+        if len(args) == 4 and args[3]:
+            self._changed_ids.add(str(args[3]))
+        self._stale = True
+        metrics.incr("counsellor_index.notifications")
+
+    async def refresh(self, db, full: bool = False) -> int:
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            t0 = time.perf_counter()
+            # Cleared before reading, so a notification that lands mid-refresh triggers another one
+            self._stale = False
+            changed_ids, self._changed_ids = self._changed_ids, set()
+            try:
+                if full or self._high_water is None or self.full_due:
+                    changed = self.load(await db.fetch("counsellors"), full=True)
+                    self._full_at = time.monotonic()
+                else:
+                    # Notified profiles by id (updated_at is not bumped on every UPDATE), profiles
+                    # edited since the last refresh, and the id list to catch deletions
+                    changed = self.load(await db.fetch("counsellors_by_id", sorted(changed_ids)), full=False) if changed_ids else 0
+                    changed += self.load(await db.fetch("counsellors_since", self._high_water), full=False)
+                    self.retain(row["id"] for row in await db.fetch("counsellor_ids"))
+            except Exception:
+                self._changed_ids |= changed_ids
+                self._stale = True
+                raise
+            metrics.incr("counsellor_index.refreshes")
+            metrics.observe("counsellor_index.refresh_ms", (time.perf_counter() - t0) * 1000)
+            return changed
+
+    async def ensure_fresh(self, db) -> None:
+        """First call waits for the load; after that a due refresh runs in the
+        background and queries answer from the current index meanwhile."""
+        if self._loaded_at is None:
+            await self.refresh(db)
+            return
+        if self.due and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_quietly(db))
+
+    async def _refresh_quietly(self, db) -> None:
+        try:
+            await self.refresh(db)
+        except Exception:
+            metrics.incr("counsellor_index.refresh_errors")
+            logger.exception("Counsellor index refresh failed, serving the previous index")
+
+    async def listen(self, url: str, ssl: str) -> None:
+        """Start listening for profile changes. Only the first call connects
+        (later and concurrent ones return at once); a dropped connection is
+        re-established in the background, as is a failed first attempt."""
+        if self._listen_args is not None:
+            return
+        self._listen_args = (url, ssl)
+        try:
+            await self._connect_listener()
+        except Exception:
+            self._schedule_reconnect()
+            raise
+
+    async def _connect_listener(self) -> None:
+        # A dedicated connection, so LISTEN never holds one of the pool's
+        import asyncpg
+
+        url, ssl = self._listen_args
+        conn = await asyncpg.connect(url, ssl=ssl)
+        try:
+            await conn.add_listener(COUNSELLOR_NOTIFY_CHANNEL, self.mark_stale)
+        except Exception:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._listener_lost)
+        self._listener = conn
+        logger.info("Listening on %s for counsellor profile changes", COUNSELLOR_NOTIFY_CHANNEL)
+
+    def _listener_lost(self, conn) -> None:
+        if conn is not self._listener:
+            return
+        self._listener = None
+        # Notifications sent while disconnected are lost: reload everything on the next query
+        self._full_at = None
+        self._stale = True
+        metrics.incr("counsellor_index.listener_lost")
+        logger.warning("Counsellor change notifications lost their connection, reconnecting")
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 1.0
+        while self._listener is None:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect_listener()
+            except Exception as e:
+                metrics.incr("counsellor_index.listen_errors")
+                logger.warning("Could not re-establish counsellor change notifications: %s", e)
+                delay = min(delay * 2, COUNSELLOR_LISTEN_RETRY_MAX_S)
+        # Changes made while reconnecting were not notified either
+        self._full_at = None
+        self._stale = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counsellors": len(self._counsellors),
+                "languages": sorted(k for k, v in self._by_language.items() if v),
+                "age_s": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+                "full_age_s": round(time.monotonic() - self._full_at, 1) if self._full_at else None,
+                "listening": self._listener is not None,
+                **metrics.snapshot("counsellor_index."),
+            }
+
+# Shared by the MCP server's tools
+counsellor_index = CounsellorIndex()
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------- Async Postgres for the MCP tools ---------------
+DB_URL = os.getenv("DB_URL")
+DB_SSL = os.getenv("DB_SSL", "require")  # asyncpg sslmode; "disable" for a local Postgres
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+
+# Every query the tools run, by name. Only $n parameters, never string formatting;
+# asyncpg prepares each one once per connection and reuses it from its statement cache
+STATEMENTS = {
+    "counsellors": """
+        SELECT cp.id, u.first_name, u.last_name, cp.specialization, cp.languages_spoken,
+               cp.availability_schedule, cp.current_availability, cp.updated_at
+        FROM counselor_profiles cp
+        JOIN users u ON u.id = cp.user_id
+    """,
+    # Incremental refresh of the counsellor index; >= so rows sharing the last timestamp are not missed
+    "counsellors_since": """
+        SELECT cp.id, u.first_name, u.last_name, cp.specialization, cp.languages_spoken,
+               cp.availability_schedule, cp.current_availability, cp.updated_at
+        FROM counselor_profiles cp
+        JOIN users u ON u.id = cp.user_id
+        WHERE cp.updated_at >= $1
+    """,
+    # Profiles named by change notifications; compared as text so the id column's type does not matter
+    "counsellors_by_id": """
+        SELECT cp.id, u.first_name, u.last_name, cp.specialization, cp.languages_spoken,
+               cp.availability_schedule, cp.current_availability, cp.updated_at
+        FROM counselor_profiles cp
+        JOIN users u ON u.id = cp.user_id
+        WHERE cp.id::text = ANY($1::text[])
+    """,
+    "counsellor_ids": "SELECT id FROM counselor_profiles",
+    # Written by the alert outbox; $1 is its idempotency key, so a redelivered alert is a no-op
+    "insert_crisis_alert": """
+        INSERT INTO crisis_alerts (idempotency_key, alert_type, severity_level, description, status, created_at)
+        VALUES ($1, 'ai_detected', $2, $3, 'active', to_timestamp($4))
+        ON CONFLICT (idempotency_key) DO NOTHING
+    """,
+    "insert_misuse_flag": """
+        INSERT INTO misuse_flag (id, idempotency_key, user_id, report_type, report_reason)
+        VALUES (uuid_generate_v4(), $1, uuid_generate_v4(), 'ai_detected', $2)
+        ON CONFLICT (idempotency_key) DO NOTHING
+    """,
+}
+
+REQUIRED_TABLES = ("users", "counselor_profiles", "crisis_alerts", "misuse_flag")
+
+class Database:
+    """One asyncpg pool per process, opened on first use (inside the server's
+    event loop) and health-checked before it is handed out."""
+
+    def __init__(self, url: str | None = DB_URL, min_size: int = DB_POOL_MIN, max_size: int = DB_POOL_MAX):
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._start_lock: asyncio.Lock | None = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url)
+
+    async def pool(self):
+        if self._pool is not None:
+            return self._pool
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._pool is None:
+                await self.start()
+        return self._pool
+
+    async def start(self) -> None:
+        import asyncpg
+
+        if not self.configured:
+            raise RuntimeError("DB_URL is not set")
+        t0 = time.perf_counter()
+        pool = await asyncpg.create_pool(
+            self.url,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            ssl=DB_SSL,
+        )
+        try:
+            await self.health_check(pool)
+        except Exception:
+            await pool.close()
+            raise
+        self._pool = pool
+        metrics.observe("db.connect_ms", (time.perf_counter() - t0) * 1000)
+        logger.info("Postgres pool ready (%d-%d connections)", self.min_size, self.max_size)
+
+    @staticmethod
+    async def health_check(pool) -> Dict[str, Any]:
+        # Fails fast at startup on a wrong URL, a missing table or a statement that no longer matches the schema
+        async with pool.acquire() as conn:
+            t0 = time.perf_counter()
+            await conn.fetchval("SELECT 1")
+            ping_ms = (time.perf_counter() - t0) * 1000
+            missing = [t for t in REQUIRED_TABLES if await conn.fetchval("SELECT to_regclass($1)", t) is None]
+            if missing:
+                raise RuntimeError(f"Missing tables: {', '.join(missing)}")
+            for name, sql in STATEMENTS.items():
+                try:
+                    await conn.prepare(sql)
+                except Exception as e:
+                    raise RuntimeError(f"Statement '{name}' does not match the schema: {e}") from e
+        metrics.observe("db.ping_ms", ping_ms)
+        return {"ping_ms": round(ping_ms, 2), "tables": list(REQUIRED_TABLES), "statements": list(STATEMENTS)}
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        pool = await self.pool()
+        t0 = time.perf_counter()
+        async with pool.acquire() as conn:
+            metrics.observe("db.acquire_ms", (time.perf_counter() - t0) * 1000)
+            self._in_use += 1
+            self._update_gauges(pool)
+            try:
+                yield conn
+            finally:
+                self._in_use -= 1
+                self._update_gauges(pool)
+
+    def _update_gauges(self, pool) -> None:
+        metrics.set_gauge("db.pool.size", pool.get_size())
+        metrics.set_gauge("db.pool.in_use", self._in_use)
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        metrics.set_gauge("db.pool.peak_in_use", self._peak_in_use)
+
+    async def _run(self, method: str, name: str, *args):
+        async with self.connection() as conn:
+            t0 = time.perf_counter()
+            try:
+                return await getattr(conn, method)(STATEMENTS[name], *args)
+            except Exception:
+                metrics.incr(f"db.errors.{name}")
+                raise
+            finally:
+                metrics.observe(f"db.query_ms.{name}", (time.perf_counter() - t0) * 1000)
+
+    async def fetch(self, name: str, *args) -> List[Any]:
+        return await self._run("fetch", name, *args)
+
+    async def execute(self, name: str, *args) -> str:
+        return await self._run("execute", name, *args)
+
+    async def executemany(self, name: str, rows: List[tuple]) -> None:
+        return await self._run("executemany", name, rows)
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self._pool
+        return {
+            "configured": self.configured,
+            "open": pool is not None,
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "in_use": self._in_use,
+            "max_size": self.max_size,
+            **metrics.snapshot("db."),
+        }
+
+# Shared by every tool in the MCP server
+db = Database()
+
+async def startup_check(database: Database = db) -> None:
+    # Run before the server starts its own loop; the pool is reopened lazily inside that loop
+    await database.start()
+    await database.close()
+
+async def self_check() -> Dict[str, Any]:
+    """Runs against a real (e.g. local) Postgres: health check, every read
+    statement, and every write inside a transaction that is rolled back."""
+    report = {"health": await Database.health_check(await db.pool())}
+    report["counsellors"] = len(await db.fetch("counsellors"))
+    async with db.connection() as conn:
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            await conn.execute(STATEMENTS["insert_crisis_alert"], "self-check", 8, "self-check", time.time())
+            await conn.execute(STATEMENTS["insert_misuse_flag"], "self-check", "self-check")
+            report["writes"] = "ok (rolled back)"
+        finally:
+            await tx.rollback()
+    report["pool"] = db.stats()
+    await db.close()
+    return report
+
+if __name__ == "__main__":
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(self_check()), indent=2, default=str))
@@ -0,0 +1,160 @@
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+import metrics
+from batching import MicroBatcher
+from inference_backends import load_cached_sequence_classifier, prepare_sequence_classifier
+from model_registry import registry
+
+EMOTION_MAX_BATCH_SIZE = int(os.getenv("EMOTION_MAX_BATCH_SIZE", "32"))
+EMOTION_MAX_WAIT_MS = float(os.getenv("EMOTION_MAX_WAIT_MS", "5"))
+
+def select_top(probs: np.ndarray, threshold: float, top_n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Top-N label ids per row, best first, without sorting every label.
+    Returns (ids, scores, keep) where keep marks scores above threshold."""
+    k = max(1, min(top_n, probs.shape[1]))
+    if k < probs.shape[1]:
+        candidates = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), (probs.shape[0], k))
+    scores = np.take_along_axis(probs, candidates, axis=1)
+    order = np.argsort(-scores, axis=1)
+    ids = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    return ids, scores, scores >= threshold
+
+# Common multilingual emotion heads (Ekman-style and sentiment-style names) onto GoEmotions labels
+DEFAULT_LABEL_ALIASES = {
+    "happy": "joy", "happiness": "joy", "joyful": "joy",
+    "sad": "sadness", "angry": "anger", "scared": "fear", "fearful": "fear",
+    "surprised": "surprise", "disgusted": "disgust", "worry": "nervousness", "anxiety": "nervousness",
+    "shame": "embarrassment", "guilt": "remorse", "others": "neutral", "none": "neutral",
+}
+
+def build_label_map(source_labels: Sequence[str], target_labels: Sequence[str], overrides: Dict[str, str] | None = None) -> Dict[str, str]:
+    """Maps source label names onto the target label set: same name first,
+    then the alias table, then explicit overrides (e.g. EMOTION_LABEL_MAP)."""
+    targets = {label.lower(): label for label in target_labels}
+    label_map = {}
+    for label in source_labels:
+        key = label.lower()
+        if key in targets:
+            label_map[key] = targets[key]
+        elif DEFAULT_LABEL_ALIASES.get(key) in targets:
+            label_map[key] = targets[DEFAULT_LABEL_ALIASES[key]]
+    for source, target in (overrides or {}).items():
+        if target.lower() in targets:
+            label_map[source.lower()] = targets[target.lower()]
+    return label_map
+
+class EmotionEngine:
+    """Multi-label emotion classifier that scores many texts in one forward
+    pass. Threshold, temperature and top-N are fixed at construction."""
+
+    def __init__(self, model_name: str, device: str, threshold: float, temperature: float, top_n: int,
+                 registry_key: str = "emotion", activation: str = "sigmoid",
+                 map_onto: "EmotionEngine | None" = None, label_overrides: Dict[str, str] | None = None,
+                 backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.activation = activation
+        # Optionally report this model's labels in another engine's label set; unmapped labels are dropped
+        self.map_onto = map_onto
+        self.label_overrides = label_overrides
+        self._label_map: Dict[str, str] | None = None
+        # The int8 and onnx backends are CPU-only
+        self.device = device if backend == "torch" else "cpu"
+        self.threshold = threshold
+        self.temperature = temperature
+        self.top_n = top_n
+        self.registry_key = registry_key
+        registry.register(registry_key, self._load)
+
+        self.batcher = MicroBatcher(
+            lambda _, texts: self.classify_batch(texts),
+            max_batch_size=EMOTION_MAX_BATCH_SIZE,
+            max_wait_ms=EMOTION_MAX_WAIT_MS,
+            name=registry_key,
+        )
+
+    def _load(self):
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # An int8 / onnx artefact built by an earlier process: no fp32 load at all
+        cached = load_cached_sequence_classifier(self.model_name, self.backend)
+        if cached is not None:
+            return tokenizer, cached
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+        model.to(self.device)
+        model.eval()
+        return tokenizer, prepare_sequence_classifier(model, tokenizer, self.model_name, self.backend)
+
+    @property
+    def id2label(self) -> Dict[int, str]:
+        return registry.get(self.registry_key)[1].config.id2label
+
+    @property
+    def label_map(self) -> Dict[str, str] | None:
+        if self.map_onto is None:
+            return None
+        if self._label_map is None:
+            self._label_map = build_label_map(self.id2label.values(), self.map_onto.id2label.values(), self.label_overrides)
+        return self._label_map
+
+    def probabilities(self, texts: Sequence[str]) -> np.ndarray:
+        import torch
+
+        with registry.use(self.registry_key) as (tokenizer, model):
+            probs = np.empty((len(texts), model.config.num_labels), dtype=np.float32)
+
+            # Similar lengths share a chunk so dynamic padding stays small
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            for start in range(0, len(order), EMOTION_MAX_BATCH_SIZE):
+                chunk = order[start:start + EMOTION_MAX_BATCH_SIZE]
+                inputs = tokenizer([texts[i] for i in chunk], return_tensors="pt", truncation=True,
+                                   padding="longest").to(self.device)
+                with torch.no_grad():
+                    logits = model(**inputs).logits / self.temperature
+                    if self.activation == "softmax":
+                        scores = torch.softmax(logits, dim=-1)  # single-label heads
+                    else:
+                        scores = torch.sigmoid(logits)  # multi-label uses sigmoid
+                    probs[chunk] = scores.float().cpu().numpy()
+        metrics.incr(f"{self.registry_key}.texts", len(texts))
+        return probs
+
+    def classify_arrays(self, texts: Sequence[str], threshold: float | None = None, top_n: int | None = None):
+        probs = self.probabilities(texts)
+        return select_top(probs, self.threshold if threshold is None else threshold,
+                          self.top_n if top_n is None else top_n)
+
+    def classify_batch(self, texts: Sequence[str], threshold: float | None = None, top_n: int | None = None) -> List[List[tuple]]:
+        if not texts:
+            return []
+        ids, scores, keep = self.classify_arrays(texts, threshold, top_n)
+        id2label = self.id2label
+        results = [
+            [(id2label[int(i)], float(s)) for i, s, k in zip(row_ids, row_scores, row_keep) if k]
+            for row_ids, row_scores, row_keep in zip(ids, scores, keep)
+        ]
+        label_map = self.label_map
+        if label_map is not None:
+            results = [self._map_labels(row, label_map) for row in results]
+        return results
+
+    @staticmethod
+    def _map_labels(row: List[tuple], label_map: Dict[str, str]) -> List[tuple]:
+        mapped: Dict[str, float] = {}
+        for label, score in row:
+            target = label_map.get(label.lower())
+            if target is not None and score > mapped.get(target, -1.0):
+                mapped[target] = score
+        return sorted(mapped.items(), key=lambda x: x[1], reverse=True)
+
+    def classify(self, text: str) -> List[tuple]:
+        return self.batcher(text)
+
+    async def classify_async(self, text: str) -> List[tuple]:
+        return await self.batcher.asubmit(text)
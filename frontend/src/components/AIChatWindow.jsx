@@ -3,7 +3,6 @@ import styled from 'styled-components';
 import { db } from '../firebase';
 import { addDoc, collection, onSnapshot, orderBy, query, serverTimestamp, doc, setDoc } from 'firebase/firestore';
 import { useSocket } from '../hooks/useSocket';
-import axios from 'axios';
 
 const Container = styled.div`
   display: flex;
@@ -59,6 +58,7 @@ const AIChatWindow = () => {
   const peerUserId = 'ai';
   const [text, setText] = useState('');
   const [messages, setMessages] = useState([]);
+  const [draft, setDraft] = useState(''); // AI reply while it is still being generated
   const bottomRef = useRef(null);
   const socket = useSocket(currentUserId);
 
@@ -79,7 +79,43 @@ const AIChatWindow = () => {
     return () => unsub();
   }, [chatId]);
 
-
+  // Reads the NDJSON stream from /chat/stream, showing tokens as they arrive; resolves to the final reply
+  const streamReply = async (message) => {
+    const res = await fetch('http://localhost:3001/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        message,
+        language: 'tam_Taml', // Default to Tamil, can be made dynamic later
+        session_id: chatId // keeps the agent's conversation history per chat
+      }),
+    });
+    if (!res.ok || !res.body) throw new Error(`AI service answered ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+        if (event.type === 'token') {
+          setDraft(d => d + event.text);
+          bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
+        } else if (event.type === 'done') {
+          return event.response;
+        } else if (event.type === 'error') {
+          throw new Error(event.error);
+        }
+      }
+    }
+    throw new Error('AI response stream ended early');
+  };
 
   const sendMessage = async (e) => {
     e.preventDefault();
@@ -115,14 +151,11 @@ const AIChatWindow = () => {
 
     // Get AI response
     try {
-      const response = await axios.post('http://localhost:3001/chat', { 
-        message: trimmed, 
-        language: 'tam_Taml' // Default to Tamil, can be made dynamic later
-      });
+      const reply = await streamReply(trimmed);
       const aiMessageData = {
         senderId: peerUserId,
         receiverId: currentUserId,
-        text: response.data.response,
+        text: reply,
         createdAt: new Date(),
         chatId: chatId,
       };
@@ -134,11 +167,13 @@ const AIChatWindow = () => {
       // Update lastMessage
       await setDoc(chatRef, {
         participants: [currentUserId, peerUserId].sort(),
-        lastMessage: { text: response.data.response, timestamp: serverTimestamp() },
+        lastMessage: { text: reply, timestamp: serverTimestamp() },
       }, { merge: true });
     } catch (error) {
       console.error('Error getting AI response:', error);
       // Optionally, add an error message
+    } finally {
+      setDraft('');
     }
   };
 
@@ -150,6 +185,7 @@ const AIChatWindow = () => {
             {m.text}
           </Bubble>
         ))}
+        {draft && <Bubble $own={false}>{draft}</Bubble>}
         <div ref={bottomRef} />
       </Messages>
       <Composer onSubmit={sendMessage}>
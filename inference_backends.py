@@ -0,0 +1,279 @@
+import functools
+import logging
+import os
+import re
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# --------------- CPU-first inference backends ---------------
+# "torch"     : the model as loaded (fp32 on CPU, or whatever DEVICE_FOR_* says)
+# "int8"      : PyTorch dynamic int8 quantization of every nn.Linear
+# "onnx"      : ONNX Runtime on CPU (exported once, then loaded from the cache)
+# "onnx-int8" : ONNX Runtime with dynamically quantized int8 weights
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+BACKEND_CACHE_DIR = os.getenv("BACKEND_CACHE_DIR", ".model_cache")
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))  # 0 lets torch / ORT decide
+
+@functools.lru_cache(maxsize=None)
+def model_revision(model_name: str) -> str:
+    """What the checkpoint currently is: the Hub commit it resolves to, or for a
+    local directory the newest modification time inside it."""
+    if os.path.isdir(model_name):
+        newest = max((os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(model_name) for f in files), default=0)
+        return f"local{int(newest)}"
+    from huggingface_hub import snapshot_download
+
+    # Only the small JSON files; the snapshot directory is named after the commit hash
+    return os.path.basename(snapshot_download(model_name, allow_patterns=["*.json"]))[:12]
+
+def cache_path(model_name: str, backend: str, suffix: str) -> str:
+    # The checkpoint's revision is part of the name, so an updated checkpoint is rebuilt, never served stale
+    os.makedirs(BACKEND_CACHE_DIR, exist_ok=True)
+    safe = re.sub(r"[^\w.-]+", "__", model_name)
+    return os.path.join(BACKEND_CACHE_DIR, f"{safe}@{model_revision(model_name)}.{backend}{suffix}")
+
+def configure_threads():
+    import torch
+    if CPU_THREADS > 0:
+        torch.set_num_threads(CPU_THREADS)
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+# --------------- PyTorch dynamic int8 ---------------
+def int8_path(model_name: str) -> str:
+    import torch
+
+    # A pickled module is only safe to unpickle with the torch that wrote it
+    return cache_path(model_name, f"int8-torch{torch.__version__.split('+')[0]}", ".pt")
+
+def quantize_int8(module, model_name: str, cache: bool = True):
+    """Dynamic int8 quantization of nn.Linear layers, cached as a pickled
+    module (keyed by checkpoint revision and torch version) so later
+    processes skip the conversion."""
+    import torch
+
+    path = int8_path(model_name) if cache else None
+    if cache and os.path.exists(path):
+        logger.info("Loading cached int8 model %s", path)
+        return torch.load(path, weights_only=False)
+
+    module = module.to("cpu").eval()
+    quantized = torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    if cache:
+        torch.save(quantized, path)
+    return quantized
+
+# --------------- ONNX Runtime ---------------
+def _ort_session(path: str):
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The onnx backends need `pip install onnx onnxruntime`") from e
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if CPU_THREADS > 0:
+        options.intra_op_num_threads = CPU_THREADS
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+def _quantize_onnx(src: str, dst: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+
+class OnnxSequenceClassifier:
+    """Drop-in for a transformers sequence classifier: `model(**inputs).logits`."""
+
+    def __init__(self, path: str, config):
+        self.session = _ort_session(path)
+        self.config = config
+        self.nbytes = os.path.getsize(path)
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, **inputs):
+        import torch
+        feed = {k: v.cpu().numpy() for k, v in inputs.items() if k in self._inputs}
+        logits = self.session.run(["logits"], feed)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+def export_sequence_classifier(model, tokenizer, model_name: str, backend: str = "onnx"):
+    """One-time ONNX export (dynamic batch and sequence axes), cached on disk."""
+    import torch
+
+    fp32_path = cache_path(model_name, "onnx", ".onnx")
+    if not os.path.exists(fp32_path):
+        model = model.to("cpu").eval()
+
+        class _Logits(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, input_ids, attention_mask):
+                return self.inner(input_ids=input_ids, attention_mask=attention_mask).logits
+
+        dummy = tokenizer(["warm up export"], return_tensors="pt")
+        torch.onnx.export(
+            _Logits(model),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+        logger.info("Exported %s to %s", model_name, fp32_path)
+
+    path = fp32_path
+    if backend == "onnx-int8":
+        path = cache_path(model_name, "onnx-int8", ".onnx")
+        if not os.path.exists(path):
+            _quantize_onnx(fp32_path, path)
+    return OnnxSequenceClassifier(path, model.config)
+
+def load_cached_sequence_classifier(model_name: str, backend: str):
+    """The backend's cached artefact, loaded without the fp32 weights; None when
+    it has not been built yet (or the backend is plain torch)."""
+    check_backend(backend)
+    if backend == "torch":
+        return None
+    path = int8_path(model_name) if backend == "int8" else cache_path(model_name, backend, ".onnx")
+    if not os.path.exists(path):
+        return None
+    configure_threads()
+    if backend == "int8":
+        import torch
+
+        logger.info("Loading cached int8 model %s", path)
+        return torch.load(path, weights_only=False)
+    from transformers import AutoConfig
+
+    return OnnxSequenceClassifier(path, AutoConfig.from_pretrained(model_name))
+
+def prepare_sequence_classifier(model, tokenizer, model_name: str, backend: str):
+    check_backend(backend)
+    if backend == "torch":
+        return model
+    configure_threads()
+    if backend == "int8":
+        return quantize_int8(model, model_name)
+    return export_sequence_classifier(model, tokenizer, model_name, backend)
+
+def export_gliner(model_name: str, backend: str = "onnx") -> str:
+    """One-time ONNX export of a GLiNER checkpoint, following GLiNER's own
+    convert_to_onnx recipe: the encoder and span scorer become one graph, the
+    span decoding stays in Python. Returns a directory GLiNER can load with
+    load_onnx_model=True, holding model.onnx (and model_quantized.onnx)."""
+    from gliner import GLiNER
+    import torch
+
+    export_dir = cache_path(model_name, "gliner-onnx", "")
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    if not os.path.exists(fp32_path):
+        model = GLiNER.from_pretrained(model_name, load_tokenizer=True)
+        model.eval()
+        model.save_pretrained(export_dir)
+        model.data_processor.transformer_tokenizer.save_pretrained(export_dir)
+
+        inputs, _ = model.prepare_model_inputs(["Export GLiNER once, reuse it after."], ["Person", "Location"])
+        names = ["input_ids", "attention_mask", "words_mask", "text_lengths"]
+        dynamic_axes = {
+            "input_ids": {0: "batch", 1: "seq"},
+            "attention_mask": {0: "batch", 1: "seq"},
+            "words_mask": {0: "batch", 1: "seq"},
+            "text_lengths": {0: "batch", 1: "value"},
+            "logits": {0: "position", 1: "batch", 2: "seq", 3: "span"},
+        }
+        if model.config.span_mode != "token_level":
+            names += ["span_idx", "span_mask"]
+            dynamic_axes.update({"span_idx": {0: "batch", 1: "spans", 2: "idx"}, "span_mask": {0: "batch", 1: "spans"}})
+        try:
+            torch.onnx.export(
+                model.model,
+                tuple(inputs[name] for name in names),
+                fp32_path,
+                input_names=names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+            )
+        except Exception as e:
+            if os.path.exists(fp32_path):
+                os.remove(fp32_path)
+            raise RuntimeError(f"ONNX export of {model_name} failed; use PII_BACKEND=torch or int8: {e}") from e
+        logger.info("Exported %s to %s", model_name, fp32_path)
+
+    if backend == "onnx-int8":
+        int8_path = os.path.join(export_dir, "model_quantized.onnx")
+        if not os.path.exists(int8_path):
+            _quantize_onnx(fp32_path, int8_path)
+    return export_dir
+
+def load_gliner(model_name: str, backend: str):
+    """GLiNER for the PII engine. The onnx backends load the file named by
+    PII_ONNX_FILE from the checkpoint when it ships one; otherwise the model
+    is exported once into BACKEND_CACHE_DIR and loaded from there."""
+    from gliner import GLiNER
+
+    check_backend(backend)
+    if backend in ("onnx", "onnx-int8"):
+        configure_threads()
+        onnx_file = "model_quantized.onnx" if backend == "onnx-int8" else "model.onnx"
+        shipped = os.getenv("PII_ONNX_FILE")
+        source = model_name if shipped else export_gliner(model_name, backend)
+        return GLiNER.from_pretrained(
+            source,
+            load_onnx_model=True,
+            load_tokenizer=True,
+            onnx_model_file=shipped or onnx_file,
+        )
+
+    model = GLiNER.from_pretrained(model_name)
+    model.eval()
+    if backend == "int8":
+        configure_threads()
+        model.model = quantize_int8(model.model, model_name)
+    return model
+
+# --------------- Parity against fp32 ---------------
+def emotion_parity(reference, candidate, texts) -> dict:
+    """Compares a backend's EmotionEngine against the fp32 torch one."""
+    import numpy as np
+
+    ref = reference.probabilities(texts)
+    out = candidate.probabilities(texts)
+    ref_labels = reference.classify_batch(texts)
+    out_labels = candidate.classify_batch(texts)
+    same_top = [bool(a) == bool(b) and (not a or a[0][0] == b[0][0]) for a, b in zip(ref_labels, out_labels)]
+    same_set = [{l for l, _ in a} == {l for l, _ in b} for a, b in zip(ref_labels, out_labels)]
+    return {
+        "texts": len(texts),
+        "max_abs_diff": float(np.max(np.abs(ref - out))) if len(texts) else 0.0,
+        "top1_agreement": sum(same_top) / max(len(texts), 1),
+        "label_set_agreement": sum(same_set) / max(len(texts), 1),
+    }
+
+def pii_parity(reference, candidate, texts, labels) -> dict:
+    """Span-level F1 of a backend's PIIEngine against the fp32 torch one."""
+    ref = reference.model_predict_batch(texts, labels)
+    out = candidate.model_predict_batch(texts, labels)
+    tp = fp = fn = 0
+    for a, b in zip(ref, out):
+        ref_spans = {(e["start"], e["end"], e["label"]) for e in a}
+        out_spans = {(e["start"], e["end"], e["label"]) for e in b}
+        tp += len(ref_spans & out_spans)
+        fp += len(out_spans - ref_spans)
+        fn += len(ref_spans - out_spans)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"texts": len(texts), "precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
@@ -1,15 +1,21 @@
+import argparse
 import asyncio
+import json
 import os
+import sys
+import time
 import uuid
+from contextvars import ContextVar
+from langchain_mcp_adapters.callbacks import Callbacks
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import InMemorySaver
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 
 from privacy_gateway import *
 from Audit_codes import AuditLogger
+from session_saver import BoundedSessionSaver
 
 load_dotenv()
 
@@ -17,32 +23,17 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 model_name = os.getenv("GEMINI_MODEL_NAME")
 TEMPERATURE_FOR_GEMINI = float(os.getenv("TEMPERATURE_FOR_GEMINI"))
 SESSION_ID = os.getenv("SESSION_ID") or str(uuid.uuid4())
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8000/sse")
+# Run turns through the privacy gateway (translation, emotion tags, PII removal) and translate replies back
+USE_PRIVACY_GATEWAY = os.getenv("USE_PRIVACY_GATEWAY", "0") == "1"
 
-async def main():
-
-    client = MultiServerMCPClient({
-        "Medical_Emergency": {
-            # CHANGED: connect to remote SSE endpoint (replace SERVER_IP as needed)
-            "transport": "sse",
-            "url": "http://127.0.0.1:8000/sse"
-        }
-    })
-
-    tools = await client.get_tools()
-
-    llm = ChatGoogleGenerativeAI(
-        model=model_name,
-        google_api_key=GEMINI_API_KEY,
-        temperature=TEMPERATURE_FOR_GEMINI
-    )
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are the routing LLM (Gemini). Your only job is to orchestrate server-side tools and compose a concise, empathetic final reply using tool outputs. Never answer without calling at least one tool, and never invent facts. Always consult the medical bot for supportive guidance, then add escalations as specified below.
 
 **TOOLS**
 
     get_medical_response: Primary source for guidance, coping steps, and helpline details when relevant.
-    counsellor_referral: Returns currently available counsellor information for non-urgent human handoff.
+    counsellor_referral: Returns currently available counsellor information for non-urgent human handoff. Pass the user's language and main concern (e.g. anxiety) when known.
     crisis_alert: Triggers an immediate alert to counsellors for severe risk (self-harm, imminent danger, suicidal ideation with plan).
     suggest_resource: Non-urgent educational/coping resources.
     flag_misuse_alert: Report harassment, threats, or obvious misuse.
@@ -60,7 +51,7 @@ You are the routing LLM (Gemini). Your only job is to orchestrate server-side to
 
     Severe/urgent risk (explicit self-harm/suicidal ideation with plan/intent, imminent danger, severe disorientation, psychosis, or safety red flags):
         1. Immediately call crisis_alert(reason) with a short, factual reason extracted from the user message.
-        2. Then call get_medical_response with the same message to fetch immediate safety steps and grounding strategies.
+        2. Then call get_medical_response with the same message and crisis=true to fetch immediate safety steps and grounding strategies.
         3. In the final reply, clearly inform that a counsellor has been alerted and will intervene soon, keep responses supportive, calm, and safety-focused, and continue engaging until human takeover.
 
 **ADDITIONAL POLICIES**
@@ -69,7 +60,7 @@ You are the routing LLM (Gemini). Your only job is to orchestrate server-side to
     Prefer this ordering unless misuse or severe risk demands a different first step:
         Normal → get_medical_response
         Moderate → get_medical_response, then counsellor_referral
-        Severe → crisis_alert first, then get_medical_response
+        Severe → crisis_alert first, then get_medical_response (crisis=true)
     Misuse: If the content is abusive or clearly non-clinical misuse, call flag_misuse_alert(reason) and give a brief boundary-setting reply.
     Resources: When appropriate for non-urgent support, optionally call suggest_resource after get_medical_response.
     Helplines (India-only): When helplines are relevant, rely on get_medical_response to surface details, and ensure references are India-only (Tele-MANAS 14416/1-800-891-4416, Kiran 1800-599-0019, iCALL 9152987821, Vandrevala 9999666555, Aasra 9820466726, Snehi 9582208181).
@@ -78,80 +69,247 @@ You are the routing LLM (Gemini). Your only job is to orchestrate server-side to
 When invoking get_medical_response, pass a compact session summary so the bot understands prior context. create a concise summary of the last 6 to 10 conversation (max ~150 tokens).
 If no prior turns exist, set summary to “none”
         
-    """
+"""
+
+LANGUAGES = {
+    "Assamese": "asm_Beng",
+    "Kashmiri (Arabic)": "kas_Arab",
+    "Punjabi": "pan_Guru",
+    "Bengali": "ben_Beng",
+    "Kashmiri (Devanagari)": "kas_Deva",
+    "Sanskrit": "san_Deva",
+    "Bodo": "brx_Deva",
+    "Maithili": "mai_Deva",
+    "Santali": "sat_Olck",
+    "Dogri": "doi_Deva",
+    "Malayalam": "mal_Mlym",
+    "Sindhi (Arabic)": "snd_Arab",
+    "English": "eng_Latn",
+    "Marathi": "mar_Deva",
+    "Sindhi (Devanagari)": "snd_Deva",
+    "Konkani": "gom_Deva",
+    "Manipuri (Bengali)": "mni_Beng",
+    "Tamil": "tam_Taml",
+    "Gujarati": "guj_Gujr",
+    "Manipuri (Meitei)": "mni_Mtei",
+    "Telugu": "tel_Telu",
+    "Hindi": "hin_Deva",
+    "Nepali": "npi_Deva",
+    "Urdu": "urd_Arab",
+    "Kannada": "kan_Knda",
+    "Odia": "ory_Orya"
+}
+
+# --------------- Streamed tokens from the medical bot ---------------
+# get_medical_response sends its tokens as MCP progress notifications. The callback
+# below runs inside the tool call of a turn, so a context variable routes them to that turn.
+_token_sink: ContextVar = ContextVar("token_sink", default=None)
+
+async def _forward_progress(progress: float, total: float | None, message: str | None, context) -> None:
+    sink = _token_sink.get()
+    if sink is not None and message:
+        await sink(message)
+
+async def _print_token(token: str) -> None:
+    print(token, end="", flush=True)
+
+def streams_draft(language: str) -> bool:
+    # Streamed tokens are the bot's English draft: only worth showing when the reply is not translated afterwards
+    return not (USE_PRIVACY_GATEWAY and language != "eng_Latn")
+
+async def build_agent():
+    """Everything a turn needs that is worth keeping between turns: MCP tools,
+    the Gemini client and the agent with its checkpointer (one thread per session)."""
+
+    client = MultiServerMCPClient({
+        "Medical_Emergency": {
+            # CHANGED: connect to remote SSE endpoint (replace SERVER_IP as needed)
+            "transport": "sse",
+            "url": MCP_SERVER_URL
+        }
+    }, callbacks=Callbacks(on_progress=_forward_progress))
+
+    tools = await client.get_tools()
+
+    llm = ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=GEMINI_API_KEY,
+        temperature=TEMPERATURE_FOR_GEMINI
+    )
 
-    checkpointer = InMemorySaver()
+    # Bounded: a long-lived chat service would otherwise keep every session's history forever
+    checkpointer = BoundedSessionSaver()
 
-    agent = create_react_agent(
+    return create_react_agent(
         model=llm,
         tools=tools,
         checkpointer=checkpointer,
-        prompt=system_prompt
+        prompt=SYSTEM_PROMPT
     )
 
-    # Initialize the audit logger (client-side only)
-    audit = AuditLogger(log_dir="logs", session_id=SESSION_ID)
-
-    languages = {
-        "Assamese": "asm_Beng",
-        "Kashmiri (Arabic)": "kas_Arab",
-        "Punjabi": "pan_Guru",
-        "Bengali": "ben_Beng",
-        "Kashmiri (Devanagari)": "kas_Deva",
-        "Sanskrit": "san_Deva",
-        "Bodo": "brx_Deva",
-        "Maithili": "mai_Deva",
-        "Santali": "sat_Olck",
-        "Dogri": "doi_Deva",
-        "Malayalam": "mal_Mlym",
-        "Sindhi (Arabic)": "snd_Arab",
-        "English": "eng_Latn",
-        "Marathi": "mar_Deva",
-        "Sindhi (Devanagari)": "snd_Deva",
-        "Konkani": "gom_Deva",
-        "Manipuri (Bengali)": "mni_Beng",
-        "Tamil": "tam_Taml",
-        "Gujarati": "guj_Gujr",
-        "Manipuri (Meitei)": "mni_Mtei",
-        "Telugu": "tel_Telu",
-        "Hindi": "hin_Deva",
-        "Nepali": "npi_Deva",
-        "Urdu": "urd_Arab",
-        "Kannada": "kan_Knda",
-        "Odia": "ory_Orya"
+async def run_turn(agent, raw_input_text: str, session_id: str, language: str = "eng_Latn", on_token=None) -> dict:
+    # One user turn; `language` is the FLORES code the student writes in.
+    # `on_token` (async, one str argument) receives the medical bot's tokens while it generates
+    t0 = time.perf_counter()
+    _token_sink.set(on_token)
+
+    new_user_input = raw_input_text
+    if USE_PRIVACY_GATEWAY:
+        new_user_input = format_query(await pre_processing_async(raw_input_text, language, 'eng_Latn'))
+
+    # A logger per turn: it keeps per-turn state and turns may run concurrently
+    audit = AuditLogger(log_dir="logs", session_id=session_id)
+    # audit.start_interaction(raw_input_text, new_user_input, model_name=model_name)
+
+    # Invoke the agent with callbacks so we get tool timing and model I/O
+    response = await agent.ainvoke(
+        {"messages": [
+            {"role": "user", "content": new_user_input}
+        ]},
+        config={"callbacks": [audit], "configurable": {"thread_id": session_id}}
+    )
+
+    # Finalize & write the log for this turn
+    # record = audit.finalize_and_write(response)
+
+    reply = response["messages"][-1].content
+    if USE_PRIVACY_GATEWAY:
+        reply = await post_processing_async(reply, 'eng_Latn', language)
+
+    return {
+        "response": reply,
+        "session_id": session_id,
+        "language": language,
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
     }
 
+# --------------- Bulk JSONL mode ---------------
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+_TEXT_FIELDS = ("message", "text", "raw_user_input", "body")
+_ID_FIELDS = ("id", "request_id", "interaction_id")
+
+def read_records(path: str):
+    # Streams the file so backfills larger than memory work; "-" reads stdin.
+    # A line that is not valid JSON is yielded as its ValueError, so it fails on its own
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = e
+            yield line_no, record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _first(record: dict, fields) -> str | None:
+    return next((record[k] for k in fields if record.get(k)), None)
+
+async def run_record(agent, line_no: int, record, language: str) -> dict:
+    if isinstance(record, ValueError):
+        return {"id": line_no, "error": f"invalid JSON: {record}"}
+    if not isinstance(record, dict):
+        return {"id": line_no, "error": f"expected a JSON object, got {type(record).__name__}"}
+    record_id = _first(record, _ID_FIELDS) or line_no
+    text = _first(record, _TEXT_FIELDS)
+    if not isinstance(text, str):
+        return {"id": record_id, "error": f"no text in any of {list(_TEXT_FIELDS)}"}
+    # Like the CLI argument: a FLORES code or a language name
+    record_language = record.get("language") or language
+    if not isinstance(record_language, str):
+        return {"id": record_id, "error": "language must be a string"}
+    record_language = LANGUAGES.get(record_language, record_language)
+    if record_language not in LANGUAGES.values():
+        return {"id": record_id, "error": f"unknown language '{record_language}'"}
+    # Every record is its own session unless it names one, so histories never mix
+    session_id = str(record.get("session_id") or uuid.uuid4())
+    try:
+        result = await run_turn(agent, text, session_id, record_language)
+    except Exception as e:
+        return {"id": record_id, "error": f"{type(e).__name__}: {e}"}
+    return {"id": record_id, **result}
+
+async def run_bulk(agent, path: str, out, language: str, concurrency: int = BULK_CONCURRENCY) -> dict:
+    """Processes a JSONL file with at most `concurrency` turns in flight and
+    writes one JSON line per record as soon as it finishes (completion order)."""
+    slots = asyncio.Semaphore(max(1, concurrency))
+    pending = set()
+    done = failed = 0
+    t0 = time.perf_counter()
+
+    async def one(line_no, record):
+        nonlocal done, failed
+        try:
+            result = await run_record(agent, line_no, record, language)
+        except Exception as e:
+            # One bad record never takes the rest of the run down with it
+            result = {"id": line_no, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            slots.release()
+        done += 1
+        failed += "error" in result
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    for line_no, record in read_records(path):
+        # Reading waits for a free slot, so only `concurrency` records are held at once
+        await slots.acquire()
+        task = asyncio.create_task(one(line_no, record))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+    elapsed = time.perf_counter() - t0
+    return {"records": done, "failed": failed, "seconds": round(elapsed, 1),
+            "records_per_sec": round(done / elapsed, 2) if elapsed else 0.0}
+
+async def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Chat with the routing agent: interactive, one-shot or bulk JSONL")
+    parser.add_argument("message", nargs="?", help="one-shot mode: answer this message and exit")
+    parser.add_argument("language", nargs="?", default="eng_Latn", help="FLORES code or language name, e.g. tam_Taml or Tamil")
+    parser.add_argument("--bulk", metavar="JSONL", help="process every record of a JSONL file ('-' for stdin)")
+    parser.add_argument("--output", default="-", help="bulk results as JSONL (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY, help="bulk turns in flight at once")
+    parser.add_argument("--json", action="store_true", help="one-shot mode: print the result as JSON")
+    args = parser.parse_args(argv)
+    language = LANGUAGES.get(args.language, args.language)
+
+    agent = await build_agent()
+
+    if args.bulk:
+        out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+        try:
+            summary = await run_bulk(agent, args.bulk, out, language, args.concurrency)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(json.dumps(summary), file=sys.stderr)
+        return
+
+    if args.message is not None:
+        result = await run_turn(agent, args.message, SESSION_ID, language, on_token=_print_token if streams_draft(language) and not args.json else None)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print("\n\n\nResponse:" + result["response"] + "\n\n\n")
+        return
+
     # user_language = get from user frontend
-    # chosen_language = languages[user_language]
+    # chosen_language = LANGUAGES[user_language]
 
     while True:
         raw_input_text = input("Enter your query (or 'exit' to quit): ")
         if raw_input_text.lower() == 'exit':
             break
 
-        new_user_input = raw_input_text
-        # new_user_input = pre_processing(raw_input_text, 'tam_Taml', 'eng_Latn')
-        # new_user_input = raw_input_text
-        # print("\n\n\n" + new_user_input + "\n\n\n")
-
-        # Start the audit turn
-        # audit.start_interaction(raw_input_text, new_user_input, model_name=model_name)
-
-        # Invoke the agent with callbacks so we get tool timing and model I/O
-        response = await agent.ainvoke(
-            {"messages": [
-                {"role": "user", "content": new_user_input}
-            ]},
-            config={"callbacks": [audit], "configurable": {"thread_id": SESSION_ID}}
-        )
-
-        # Finalize & write the log for this turn
-        # record = audit.finalize_and_write(response)
-
-        # new_response = response["messages"][-1].content
-        print("\n\n\nResponse:" + response["messages"][-1].content + "\n\n\n")
-        # new_response = post_processing(response["messages"][-1].content, 'eng_Latn', 'tam_Taml')
-        # print(new_response + "\n\n\n")
+        result = await run_turn(agent, raw_input_text, SESSION_ID, language, on_token=_print_token if streams_draft(language) else None)
+
+        print("\n\n\nResponse:" + result["response"] + "\n\n\n")
         
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,73 +1,104 @@
+import asyncio
 import datetime
 import logging
-import ollama
-import subprocess
-import psycopg2
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 load_dotenv()
-DB_URL = os.getenv("DB_URL")
+from admission import AdmissionController, AdmissionRejected
+from alert_outbox import alert_outbox
+from counsellor_index import counsellor_index
+from db import DB_SSL, db, startup_check
+from medical_bot import MedicalBot
+
 MEDICAL_BOT = os.getenv("MEDICAL_BOT")
 
-mcp = FastMCP("mcp_server")
+@asynccontextmanager
+async def server_lifespan(server):
+    # Runs for every client session; starting the outbox worker is a no-op after the first
+    _start_outbox()
+    yield {}
 
-def stop_ollama_model(model_name):
+mcp = FastMCP("mcp_server", lifespan=server_lifespan)
 
-    try:
-        command = ["ollama", "stop", model_name]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        print(f"Successfully stopped model: {model_name}")
+# Shared across every call: pooled HTTP connections, model kept warm between turns
+medical_bot = MedicalBot(MEDICAL_BOT)
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error stopping model {model_name}: {e}")
-    
-    except FileNotFoundError:
-        print("Error: 'ollama' command not found. Ensure Ollama is installed and in your PATH.")
+# Calls beyond what the local model can serve wait here, crisis turns first
+medical_admission = AdmissionController(
+    max_concurrent=int(os.getenv("MEDICAL_BOT_MAX_CONCURRENT", "2")),
+    max_queue=int(os.getenv("MEDICAL_BOT_MAX_QUEUE", "16")),
+    max_wait_s=float(os.getenv("MEDICAL_BOT_MAX_WAIT_S", "120")),
+    name="medical_bot.admission",
+)
+
+BUSY_RESPONSE = (
+    "The support model is at capacity right now. Give brief, calm grounding advice and the India helplines: "
+    "Tele-MANAS 14416 / 1-800-891-4416, Kiran 1800-599-0019, iCALL 9152987821."
+)
 
-@mcp.tool(description="Provide mental health support or guidance based on user queries.")
-async def get_medical_response(query: str) -> str:
+@mcp.tool(description="Provide mental health support or guidance based on user queries. Set crisis=true when crisis_alert was raised for this turn.")
+async def get_medical_response(query: str, ctx: Context, crisis: bool = False) -> str:
     
     try:
-        client = ollama.AsyncClient(timeout=180)
-        
-        result = await client.generate(
-            model=MEDICAL_BOT,
-            prompt=query
-        )
-        stop_ollama_model(MEDICAL_BOT)
-        return result.get("response", "No response from model.")
+        async with medical_admission.admit("crisis" if crisis else "normal"):
+            # Tokens go out as progress notifications while generating; the full text is still the tool result
+            parts = []
+            async for token in medical_bot.stream(query):
+                parts.append(token)
+                await ctx.report_progress(len(parts), None, message=token)
+        return "".join(parts) or "No response from model."
+    
+    except AdmissionRejected as e:
+        logging.warning("get_medical_response rejected: %s", e)
+        return BUSY_RESPONSE
     
     except Exception as e:
         return f"Error while generating response: {str(e)}"
 
-@mcp.tool(description="Refer counsellors availablity if the user's mental condition is moderate.")
-def counsellor_referral():
-    
-    return """Dr. Nithin Vikas is Available."""
-
-    # conn = psycopg2.connect(DB_URL, sslmode="require")
-    # cur = conn.cursor()
+COUNSELLOR_LISTEN = os.getenv("COUNSELLOR_LISTEN", "1") == "1"
 
-    # query = """
-    #     SELECT id, name, current_availability
-    #     FROM counselor_profiles;
-    # """
+async def _counsellor_index_ready():
+    await counsellor_index.ensure_fresh(db)
+    if COUNSELLOR_LISTEN:
+        try:
+            await counsellor_index.listen(db.url, DB_SSL)
+        except Exception as e:
+            logging.warning("No change notifications for the counsellor index yet, TTL refresh until it connects: %s", e)
 
-    # cur.execute(query)
-    # rows = cur.fetchall()
+def _format_counsellor(c: dict, when: str) -> str:
+    return "ID: {id}, Name: {name}, {when}, Languages: {languages}, Specialization: {specializations}".format(
+        id = c["id"], name = c["name"], when = when,
+        languages = ", ".join(c["languages"]) or "-", specializations = ", ".join(c["specializations"]) or "-")
 
-    # counsellor_details = ""
-    # counsellor_details_format = "ID: {id}, Name: {name}, Availability: {availability}"
+@mcp.tool(description="Refer counsellors availablity if the user's mental condition is moderate. "
+                      "Optionally pass the user's language (e.g. Tamil) and main concern (e.g. anxiety).")
+async def counsellor_referral(language: str | None = None, concern: str | None = None):
+    
+    if not db.configured:
+        return """Dr. Nithin Vikas is Available."""
 
-    # for row in rows:
-    #     counsellor_details += counsellor_details_format.format(id = row[0], name = row[1], availability = row[2])
+    try:
+        await _counsellor_index_ready()
+    except Exception as e:
+        logging.exception("counsellor_referral failed")
+        return f"Counsellor details are unavailable right now: {e}"
 
-    # cur.close()
-    # conn.close()
+    # Best match first, then relax the concern, then the language
+    for lang, spec in ((language, concern), (language, None), (None, None)):
+        available = counsellor_index.available_now(lang, spec)
+        if available:
+            return "\n".join(_format_counsellor(c, f"Available now until {c['until']}") for c in available)
 
-    # return counsellor_details
+    upcoming = counsellor_index.next_available(language) or counsellor_index.next_available()
+    if upcoming:
+        return "No counsellor is available right now.\n" + "\n".join(
+            _format_counsellor(c, f"Next available {c['from']}") for c in upcoming)
+    return "No counsellor profiles found."
 
 @mcp.tool(description="Suggest resource like videos based on User's Emotions.")
 def suggest_resource(search_bar: str) -> str:
@@ -75,58 +106,53 @@ def suggest_resource(search_bar: str) -> str:
     return "Suggested Resources, It is available in resource hub."
 
 @mcp.tool(description="Alert all counsellors if the user's mental condition is severe.")
-def crisis_alert(reason: str) -> str:
+async def crisis_alert(reason: str) -> str:
     
+    # Committed locally first; the outbox worker delivers it to Postgres, retrying until it lands
+    try:
+        alert_outbox.enqueue("crisis_alert", {"severity_level": 8, "description": reason})
+    except Exception as e:
+        logging.exception("crisis_alert could not be recorded")
+        return f"Counsellor alert could not be saved: {e}"
+    _start_outbox()
     return "Counsellor Notified."
 
-    # try:
-    #     conn = psycopg2.connect(DB_URL, sslmode="require")
-    #     cur = conn.cursor()
-
-    #     query = f"""
-    #         INSERT INTO crisis_alerts (alert_type, severity_level, description, status, created_at)
-    #         VALUES ('ai_detected', 8, '{reason}', 'active', CURRENT_TIMESTAMP)
-    #     """
-
-    #     cur.execute(query)
-
-    #     conn.commit()
-
-    #     cur.close()
-    #     conn.close()
-        
-    #     return "Counsellor Alerted Successful" 
-    
-    # except Exception as e:
-    #     print("Error:", e)
-
 @mcp.tool(description="Notify admin about Miuse of the application.")
-def flag_misuse_alert(reason: str) -> str:
+async def flag_misuse_alert(reason: str) -> str:
     
+    try:
+        alert_outbox.enqueue("misuse_flag", {"report_reason": reason})
+    except Exception as e:
+        logging.exception("flag_misuse_alert could not be recorded")
+        return f"Misuse report could not be saved: {e}"
+    _start_outbox()
     return "User reported successfully."
 
-    # try:
-    #     conn = psycopg2.connect(DB_URL, sslmode="require")
-    #     cur = conn.cursor()
-
-    #     query = f"""
-    #         INSERT INTO misuse_flag (id, user_id, report_type, report_reason) 
-    #         VALUES (uuid_generate_v4(), uuid_generate_v4(), 'ai_detected', '{reason}')
-    #     """
-
-    #     cur.execute(query)
-
-    #     conn.commit()
-
-    #     cur.close()
-    #     conn.close()
-        
-    #     return "Misuse Flag Update Successful" 
-    
-    # except Exception as e:
-    #     print("Error:", e)
+def _start_outbox():
+    # Without DB_URL alerts stay in the outbox until the server runs with one
+    if db.configured:
+        alert_outbox.start(db)
+
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats(request: Request) -> JSONResponse:
+    # Live view of this process: queue depth and waits in front of the medical bot, model
+    # residency, the Postgres pool, the counsellor index and undelivered alerts
+    return JSONResponse({
+        "admission": medical_admission.stats(),
+        "medical_bot": medical_bot.stats(),
+        "db": db.stats(),
+        "counsellor_index": counsellor_index.stats(),
+        "outbox": alert_outbox.stats(),
+    })
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
+    if db.configured:
+        # Alerts wait in the outbox and the medical bot needs no database, so an unreachable
+        # Postgres or a schema mismatch is reported here but does not stop the server
+        try:
+            asyncio.run(startup_check())
+        except Exception as e:
+            logging.warning("Postgres startup check failed, alerts stay queued in the outbox until it passes: %s", e)
     logging.info("Starting the MCP Server (SSE remote)")
     mcp.run(transport="sse")  # host="0.0.0.0", port=8000
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict
+
+import ollama
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------- Local Ollama model behind the MCP server ---------------
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None lets the ollama client use its default
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "180"))
+# Seconds without a call before the model is unloaded; 0 keeps it loaded for good
+MEDICAL_BOT_IDLE_UNLOAD_S = float(os.getenv("MEDICAL_BOT_IDLE_UNLOAD_S", "600"))
+
+class MedicalBot:
+    """One shared ollama.AsyncClient (its HTTP connections are pooled) for a
+    single model. Calls ask Ollama to keep the model loaded; an idle timer
+    unloads it once nobody has used it for `idle_unload_s` seconds."""
+
+    def __init__(self, model: str, idle_unload_s: float = MEDICAL_BOT_IDLE_UNLOAD_S,
+                 host: str | None = OLLAMA_HOST, timeout: float = OLLAMA_TIMEOUT):
+        self.model = model
+        self.idle_unload_s = idle_unload_s
+        self.host = host
+        self.timeout = timeout
+        self._client: ollama.AsyncClient | None = None
+        self._active = 0
+        self._idle_timer: asyncio.TimerHandle | None = None
+        self._unload_task: asyncio.Future | None = None
+        self._resident_since: float | None = None
+
+    @property
+    def client(self) -> ollama.AsyncClient:
+        # Created on first use so it binds to the server's running event loop
+        if self._client is None:
+            self._client = ollama.AsyncClient(host=self.host, timeout=self.timeout)
+        return self._client
+
+    # ---- Residency bookkeeping ----
+    def _mark_loaded(self, load_ms: float) -> None:
+        if self._resident_since is None:
+            self._resident_since = time.monotonic()
+            metrics.incr("medical_bot.cold_starts")
+            metrics.observe("medical_bot.cold_load_ms", load_ms)
+            logger.info("%s loaded in %.0f ms", self.model, load_ms)
+        metrics.set_gauge("medical_bot.resident", 1)
+
+    def _mark_unloaded(self) -> None:
+        if self._resident_since is not None:
+            resident_s = time.monotonic() - self._resident_since
+            metrics.observe("medical_bot.resident_s", resident_s)
+            logger.info("%s unloaded after %.0f s resident (%d cold starts so far)", self.model, resident_s,
+                        metrics.snapshot("medical_bot.cold_starts")["counters"].get("medical_bot.cold_starts", 0))
+        self._resident_since = None
+        metrics.set_gauge("medical_bot.resident", 0)
+
+    # ---- Idle timer ----
+    def _arm_idle_timer(self) -> None:
+        self._cancel_idle_timer()
+        if self.idle_unload_s > 0:
+            loop = asyncio.get_running_loop()
+            self._idle_timer = loop.call_later(self.idle_unload_s, self._start_idle_unload)
+
+    def _start_idle_unload(self) -> None:
+        # Keep a reference, the loop only holds tasks weakly
+        self._unload_task = asyncio.ensure_future(self._idle_unload())
+
+    def _cancel_idle_timer(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    async def _idle_unload(self) -> None:
+        self._idle_timer = None
+        if self._active or self._resident_since is None:
+            return
+        await self.unload()
+
+    async def unload(self) -> None:
+        # An empty generate with keep_alive=0 is Ollama's way of unloading a model
+        try:
+            await self.client.generate(model=self.model, prompt="", keep_alive=0)
+            metrics.incr("medical_bot.idle_unloads")
+        except Exception as e:
+            logger.warning("Could not unload %s: %s", self.model, e)
+        self._mark_unloaded()
+
+    # ---- Calls ----
+    async def stream(self, prompt: str, **options: Any) -> AsyncIterator[str]:
+        """Yields response tokens as Ollama produces them; time-to-first-token
+        and tokens/sec are recorded and logged per call."""
+        self._cancel_idle_timer()
+        self._active += 1
+        t0 = time.perf_counter()
+        first_ms = None
+        tokens = 0
+        last = None
+        try:
+            chunks = await self.client.generate(model=self.model, prompt=prompt, keep_alive=-1, stream=True, **options)
+            async for chunk in chunks:
+                last = chunk
+                text = chunk.get("response", "")
+                if not text:
+                    continue
+                if first_ms is None:
+                    first_ms = (time.perf_counter() - t0) * 1000
+                    metrics.observe("medical_bot.ttft_ms", first_ms)
+                tokens += 1
+                yield text
+        except Exception:
+            metrics.incr("medical_bot.errors")
+            raise
+        finally:
+            self._active -= 1
+            if not self._active:
+                self._arm_idle_timer()
+
+        if last is not None:
+            self._mark_loaded(last.get("load_duration", 0) / 1e6)
+            # The final chunk carries Ollama's own count and decode time; fall back to wall clock
+            eval_count = last.get("eval_count") or tokens
+            eval_s = (last.get("eval_duration") or 0) / 1e9 or (time.perf_counter() - t0 - (first_ms or 0) / 1000)
+            tokens_per_s = eval_count / eval_s if eval_s > 0 else 0.0
+            metrics.observe("medical_bot.tokens_per_s", tokens_per_s)
+            metrics.observe("medical_bot.generate_ms", (time.perf_counter() - t0) * 1000)
+            logger.info("%s: %d tokens, first after %.0f ms, %.1f tokens/s", self.model, eval_count, first_ms or 0, tokens_per_s)
+
+    def stats(self) -> Dict[str, Any]:
+        resident_for = time.monotonic() - self._resident_since if self._resident_since is not None else 0.0
+        return {
+            "model": self.model,
+            "resident": self._resident_since is not None,
+            "resident_for_s": round(resident_for, 1),
+            "active_calls": self._active,
+            "idle_unload_s": self.idle_unload_s,
+            **metrics.snapshot("medical_bot."),
+        }
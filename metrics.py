@@ -0,0 +1,56 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+# --- Process-wide counters and timings (shared by gateway, client and server) ---
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_observations: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, float] = {}
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float) -> None:
+    # Keep count/sum/min/max only, so hot paths never grow memory
+    with _lock:
+        obs = _observations.get(name)
+        if obs is None:
+            _observations[name] = {"count": 1, "sum": value, "min": value, "max": value}
+        else:
+            obs["count"] += 1
+            obs["sum"] += value
+            obs["min"] = min(obs["min"], value)
+            obs["max"] = max(obs["max"], value)
+
+@contextmanager
+def timer(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - t0) * 1000)
+
+def snapshot(prefix: str = "") -> Dict[str, Any]:
+    with _lock:
+        observations = {}
+        for name, obs in _observations.items():
+            if name.startswith(prefix):
+                observations[name] = dict(obs, avg=obs["sum"] / obs["count"])
+        return {
+            "counters": {k: v for k, v in _counters.items() if k.startswith(prefix)},
+            "gauges": {k: v for k, v in _gauges.items() if k.startswith(prefix)},
+            "observations": observations,
+        }
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _observations.clear()
+        _gauges.clear()
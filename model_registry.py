@@ -0,0 +1,184 @@
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 means "no limit": keep every model that has been loaded
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+
+def estimate_nbytes(obj: Any) -> int:
+    # Walks torch modules (parameters + buffers) and the tuples/dicts we bundle them in
+    if obj is None:
+        return 0
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_nbytes(o) for o in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(o) for o in obj.values())
+    if isinstance(getattr(obj, "nbytes", None), int):
+        # Non-torch runtimes (e.g. ONNX Runtime sessions) report their own size
+        return obj.nbytes
+    if hasattr(obj, "parameters") and hasattr(obj, "buffers"):
+        total = sum(p.numel() * p.element_size() for p in obj.parameters())
+        total += sum(b.numel() * b.element_size() for b in obj.buffers())
+        return total
+    if hasattr(obj, "model"):
+        return estimate_nbytes(obj.model)
+    return 0
+
+def _release_device_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+class ModelRegistry:
+    """Loads each registered model once and keeps it resident, evicting the
+    least recently used entries when the memory budget is exceeded. A model
+    held through `use()` is pinned and never evicted while in use."""
+
+    def __init__(self, budget_mb: float = MODEL_MEMORY_BUDGET_MB):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._resident: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.events: list[Dict[str, Any]] = []
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._resident
+
+    @contextmanager
+    def use(self, name: str):
+        """The model, pinned until the block ends, so a concurrent load cannot
+        evict (and un-account) it while it is mid-inference."""
+        obj = self.get(name, pin=True)
+        try:
+            yield obj
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+
+    def _hit(self, name: str, pin: bool) -> Any:
+        # Called with the lock held
+        self._resident.move_to_end(name)
+        if pin:
+            self._pins[name] = self._pins.get(name, 0) + 1
+        return self._resident[name]
+
+    def get(self, name: str, pin: bool = False) -> Any:
+        with self._lock:
+            if name in self._resident:
+                metrics.incr("registry.hits")
+                return self._hit(name, pin)
+            if name not in self._loaders:
+                raise KeyError(f"Model '{name}' is not registered")
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other models stay usable meanwhile
+        with load_lock:
+            with self._lock:
+                if name in self._resident:
+                    return self._hit(name, pin)
+
+            t0 = time.perf_counter()
+            obj = self._loaders[name]()
+            load_ms = (time.perf_counter() - t0) * 1000
+            size = estimate_nbytes(obj)
+
+            with self._lock:
+                evicted = self._make_room(size, keep=name)
+                self._resident[name] = obj
+                self._sizes[name] = size
+                if pin:
+                    self._pins[name] = self._pins.get(name, 0) + 1
+                self._record("load", name, size, load_ms=round(load_ms, 1))
+                metrics.incr("registry.loads")
+                metrics.observe(f"registry.load_ms.{name}", load_ms)
+                metrics.set_gauge("registry.resident_bytes", self.resident_bytes())
+            if evicted:
+                _release_device_memory()
+            return obj
+
+    def _evict_locked(self, name: str) -> bool:
+        # Called with the lock held; the caller releases device memory once the lock is free
+        if name not in self._resident or self._pins.get(name):
+            return False
+        del self._resident[name]
+        size = self._sizes.pop(name, 0)
+        self._record("evict", name, size)
+        metrics.incr("registry.evictions")
+        metrics.set_gauge("registry.resident_bytes", self.resident_bytes())
+        return True
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            evicted = self._evict_locked(name)
+        if evicted:
+            _release_device_memory()
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            names = list(self._resident)
+        for name in names:
+            self.evict(name)
+
+    def _make_room(self, incoming: int, keep: str) -> bool:
+        # Called with the lock held; evicts least recently used models that are not in use
+        if self.budget_bytes <= 0:
+            return False
+        evicted = False
+        while self.resident_bytes() + incoming > self.budget_bytes:
+            victim = next((n for n in self._resident if n != keep and not self._pins.get(n)), None)
+            if victim is None:
+                break
+            evicted |= self._evict_locked(victim)
+        if self.resident_bytes() + incoming > self.budget_bytes:
+            logger.warning("Model budget exceeded: %.1f MB resident, %.1f MB budget (in use: %s)",
+                           (self.resident_bytes() + incoming) / 2**20, self.budget_bytes / 2**20,
+                           ", ".join(self._pins) or "none")
+        return evicted
+
+    def _record(self, event: str, name: str, size: int, **extra) -> None:
+        rec = {"event": event, "model": name, "size_mb": round(size / 2**20, 1),
+               "resident_mb": round(self.resident_bytes() / 2**20, 1), "time": time.time(), **extra}
+        self.events.append(rec)
+        del self.events[:-100]
+        logger.info("registry %s %s (%.1f MB, resident %.1f MB)", event, name, rec["size_mb"], rec["resident_mb"])
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget_bytes / 2**20, 1),
+                "resident_mb": round(self.resident_bytes() / 2**20, 1),
+                "resident": {name: round(self._sizes[name] / 2**20, 1) for name in self._resident},
+                "in_use": dict(self._pins),
+                "registered": list(self._loaders),
+                "events": list(self.events[-20:]),
+            }
+
+# Shared by every model in the gateway
+registry = ModelRegistry()
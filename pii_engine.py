@@ -0,0 +1,279 @@
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Sequence
+
+import metrics
+from batching import MicroBatcher
+from inference_backends import load_gliner
+from model_registry import registry
+from pii_rules import MODEL_FALLBACK_LABELS, RULE_LABELS, detect_rule_entities, has_model_candidates
+
+PII_MAX_BATCH_SIZE = int(os.getenv("PII_MAX_BATCH_SIZE", "32"))
+PII_MAX_WAIT_MS = float(os.getenv("PII_MAX_WAIT_MS", "5"))
+PII_LABEL_CACHE = os.getenv("PII_LABEL_CACHE", "1") == "1"
+PII_FAST_PATH = os.getenv("PII_FAST_PATH", "1") == "1"
+# 0 derives the window from the GLiNER checkpoint's max_len
+PII_WINDOW_WORDS = int(os.getenv("PII_WINDOW_WORDS", "0"))
+PII_WINDOW_OVERLAP_WORDS = int(os.getenv("PII_WINDOW_OVERLAP_WORDS", "32"))
+
+# Fixed label set used by pre_processing; "Location" covers City and Country combined.
+# AadhaarNumber and Email are only ever found by the rule detectors in pii_rules.
+PII_LABELS = ("Person", "Organization", "PhoneNumber", "CreditCardNumber", "Location", "DateTime", "AadhaarNumber", "Email")
+
+entity_mapping = {
+    "Person": "<PERSON>",
+    "Organization": "<ORGANIZATION>",
+    "Location": "<LOCATION>",
+    "DateTime": "<DATE_TIME>",
+    "PhoneNumber": "<PHONE_NUMBER>",
+    "CreditCardNumber": "<CREDIT_CARD_NUMBER>",
+    "AadhaarNumber": "<AADHAAR_NUMBER>",
+    "Email": "<EMAIL>"
+}
+
+# --------------- Span-based anonymizer ---------------
+def _locate(text: str, entity: Dict[str, Any]) -> tuple | None:
+    start, end = entity.get("start"), entity.get("end")
+    if start is not None and end is not None and 0 <= start < end <= len(text):
+        return start, end
+    # No usable offsets: fall back to the first whole-word occurrence
+    match = re.search(rf"(?<!\w){re.escape(entity['text'])}(?!\w)", text)
+    return (match.start(), match.end()) if match else None
+
+def resolve_overlaps(text: str, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    spans = []
+    for entity in entities:
+        located = _locate(text, entity)
+        if located:
+            spans.append({**entity, "start": located[0], "end": located[1]})
+
+    # Higher score wins, then the longer span; everything overlapping a winner is dropped
+    spans.sort(key=lambda s: (-s.get("score", 0.0), -(s["end"] - s["start"]), s["start"]))
+    kept: List[Dict[str, Any]] = []
+    for span in spans:
+        if all(span["end"] <= k["start"] or span["start"] >= k["end"] for k in kept):
+            kept.append(span)
+    kept.sort(key=lambda s: s["start"])
+    return kept
+
+def anonymize_spans(text: str, entities: List[Dict[str, Any]]) -> tuple[str, List[Dict[str, Any]]]:
+    """Replaces every detected span with its placeholder in one pass and
+    returns the new text plus a span map with offsets in both texts."""
+    parts: List[str] = []
+    span_map: List[Dict[str, Any]] = []
+    cursor = out_len = 0
+    for span in resolve_overlaps(text, entities):
+        placeholder = entity_mapping.get(span["label"], f"<{span['label']}>")
+        parts.append(text[cursor:span["start"]])
+        out_len += span["start"] - cursor
+        span_map.append({
+            "label": span["label"],
+            "text": text[span["start"]:span["end"]],
+            "score": span.get("score"),
+            "placeholder": placeholder,
+            "start": span["start"],
+            "end": span["end"],
+            "out_start": out_len,
+            "out_end": out_len + len(placeholder),
+        })
+        parts.append(placeholder)
+        out_len += len(placeholder)
+        cursor = span["end"]
+    parts.append(text[cursor:])
+    return "".join(parts), span_map
+
+# --------------- Sliding windows for long messages ---------------
+_TOKEN = re.compile(r"\S+")
+
+def split_windows(text: str, window_words: int, overlap_words: int) -> List[tuple]:
+    """Splits text into overlapping word windows. Returns (start, end,
+    own_start, own_end) character ranges; a window only keeps entities that
+    start inside its own range, so overlaps are never reported twice."""
+    tokens = [(m.start(), m.end()) for m in _TOKEN.finditer(text)]
+    if len(tokens) <= window_words:
+        return [(0, len(text), 0, len(text))]
+
+    overlap_words = min(overlap_words, window_words // 2)
+    step = window_words - overlap_words
+    half = overlap_words // 2
+    windows = []
+    for first in range(0, len(tokens), step):
+        last = min(first + window_words, len(tokens))
+        is_last = last == len(tokens)
+        own_start = 0 if first == 0 else tokens[first + half][0]
+        own_end = len(text) if is_last else tokens[last - (overlap_words - half)][0]
+        windows.append((tokens[first][0], tokens[last - 1][1], own_start, own_end))
+        if is_last:
+            break
+    return windows
+
+def merge_window_entities(window_results: List[tuple]) -> List[Dict[str, Any]]:
+    # window_results: ((start, end, own_start, own_end), entities relative to the window)
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for (start, _, own_start, own_end), entities in window_results:
+        for entity in entities:
+            shifted = {**entity, "start": entity["start"] + start, "end": entity["end"] + start}
+            if not own_start <= shifted["start"] < own_end:
+                continue
+            key = (shifted["start"], shifted["end"], shifted["label"])
+            if key not in merged or shifted.get("score", 0) > merged[key].get("score", 0):
+                merged[key] = shifted
+    return sorted(merged.values(), key=lambda e: e["start"])
+
+class PIIEngine:
+    """Keeps one GLiNER model resident and runs entity detection for many
+    texts in a single forward pass."""
+
+    def __init__(self, model_name: str, threshold: float, registry_key: str = "gliner", use_label_cache: bool = PII_LABEL_CACHE,
+                 use_fast_path: bool = PII_FAST_PATH, backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.threshold = threshold
+        self.registry_key = registry_key
+        self.use_label_cache = use_label_cache
+        self.use_fast_path = use_fast_path
+        self._model_ms_per_text = None
+        self._label_cache: Dict[tuple, Any] = {}
+        self._label_cache_model_id = None
+        self._label_lock = threading.Lock()
+        registry.register(registry_key, self._load)
+
+        # Single-text calls from concurrent chats are merged here
+        self.batcher = MicroBatcher(
+            self._predict_group,
+            key_fn=lambda request: request[1],
+            max_batch_size=PII_MAX_BATCH_SIZE,
+            max_wait_ms=PII_MAX_WAIT_MS,
+            name="pii",
+        )
+
+    def _load(self):
+        return load_gliner(self.model_name, self.backend)
+
+    @property
+    def model(self):
+        return registry.get(self.registry_key)
+
+    # ---- Label-side cache ----
+    @staticmethod
+    def supports_label_cache(model) -> bool:
+        # Only bi-encoder GLiNER checkpoints encode labels separately from the text;
+        # uni-encoder ones attend over label and text tokens jointly, so there is nothing to reuse
+        config = getattr(model, "config", None)
+        return bool(getattr(config, "labels_encoder", None)) and hasattr(model, "batch_predict_with_embeds")
+
+    def label_embeddings(self, model, labels: tuple):
+        if not self.use_label_cache or not self.supports_label_cache(model):
+            return None
+        with self._label_lock:
+            if self._label_cache_model_id != id(model):
+                # The model was (re)loaded by the registry, old embeddings belong to a dead instance
+                self._label_cache.clear()
+                self._label_cache_model_id = id(model)
+            embeds = self._label_cache.get(labels)
+            if embeds is None:
+                metrics.incr("pii.label_cache.misses")
+                import torch
+                with torch.no_grad():
+                    embeds = model.encode_labels(list(labels))
+                self._label_cache[labels] = embeds
+            else:
+                metrics.incr("pii.label_cache.hits")
+            return embeds
+
+    def precompute_labels(self, labels: Sequence[str]) -> bool:
+        with registry.use(self.registry_key) as model:
+            return self.label_embeddings(model, tuple(labels)) is not None
+
+    def _raw_predict(self, model, texts: List[str], labels: Sequence[str], threshold: float) -> List[List[Dict[str, Any]]]:
+        embeds = self.label_embeddings(model, tuple(labels))
+        if embeds is not None:
+            return model.batch_predict_with_embeds(texts, embeds, list(labels), threshold=threshold)
+        if hasattr(model, "batch_predict_entities"):
+            return model.batch_predict_entities(texts, list(labels), threshold=threshold)
+        return [model.predict_entities(text, list(labels), threshold=threshold) for text in texts]
+
+    def window_words(self, model) -> int:
+        if PII_WINDOW_WORDS > 0:
+            return PII_WINDOW_WORDS
+        # GLiNER's max_len counts words and punctuation, leave headroom for the latter
+        return int(getattr(getattr(model, "config", None), "max_len", 384) * 0.75)
+
+    def model_predict_batch(self, texts: Sequence[str], labels: Sequence[str], threshold: float | None = None) -> List[List[Dict[str, Any]]]:
+        if not texts:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        t0 = time.perf_counter()
+
+        with registry.use(self.registry_key) as model:
+            # Every window of every pending message goes through one model call
+            window_words = self.window_words(model)
+            windows = [(i, w) for i, text in enumerate(texts) for w in split_windows(text, window_words, PII_WINDOW_OVERLAP_WORDS)]
+            raw = self._raw_predict(model, [texts[i][w[0]:w[1]] for i, w in windows], labels, threshold)
+
+        per_text: List[List[tuple]] = [[] for _ in texts]
+        for (i, w), entities in zip(windows, raw):
+            per_text[i].append((w, entities))
+        results = [merge_window_entities(window_results) for window_results in per_text]
+
+        per_text_ms = (time.perf_counter() - t0) * 1000 / len(texts)
+        self._model_ms_per_text = per_text_ms if self._model_ms_per_text is None else 0.9 * self._model_ms_per_text + 0.1 * per_text_ms
+        metrics.incr("pii.model.texts", len(texts))
+        metrics.incr("pii.model.windows", len(windows))
+        return results
+
+    # ---- Rule fast path ahead of the model ----
+    def split_labels(self, labels: Sequence[str]) -> tuple:
+        if not self.use_fast_path:
+            return (), tuple(labels)
+        return (tuple(l for l in labels if l in RULE_LABELS),
+                tuple(l for l in labels if l not in RULE_LABELS or l in MODEL_FALLBACK_LABELS))
+
+    def _fast_path(self, text: str, rule_labels: tuple, model_labels: tuple) -> tuple[List[Dict[str, Any]], bool]:
+        entities = detect_rule_entities(text, rule_labels) if rule_labels else []
+        metrics.incr("pii.rules.texts")
+        if entities:
+            metrics.incr("pii.rules.hits", len(entities))
+            metrics.incr("pii.rules.texts_with_hits")
+        # Digits already claimed by a rule must not count as DateTime candidates
+        masked = text
+        for entity in entities:
+            masked = masked[:entity["start"]] + " " * (entity["end"] - entity["start"]) + masked[entity["end"]:]
+        needs_model = bool(model_labels) and (not self.use_fast_path or has_model_candidates(masked, model_labels))
+        if model_labels and not needs_model:
+            metrics.incr("pii.model.skipped")
+            if self._model_ms_per_text is not None:
+                metrics.incr("pii.model.saved_ms", self._model_ms_per_text)
+        return entities, needs_model
+
+    def predict_batch(self, texts: Sequence[str], labels: Sequence[str], threshold: float | None = None) -> List[List[Dict[str, Any]]]:
+        rule_labels, model_labels = self.split_labels(labels)
+        results, pending = [], []
+        for i, text in enumerate(texts):
+            entities, needs_model = self._fast_path(text, rule_labels, model_labels)
+            results.append(entities)
+            if needs_model:
+                pending.append(i)
+        model_results = self.model_predict_batch([texts[i] for i in pending], model_labels, threshold)
+        for i, entities in zip(pending, model_results):
+            results[i] = results[i] + entities
+        return results
+
+    def _predict_group(self, labels: tuple, requests: List[tuple]) -> List[List[Dict[str, Any]]]:
+        return self.model_predict_batch([text for text, _ in requests], labels)
+
+    def predict(self, text: str, labels: Sequence[str]) -> List[Dict[str, Any]]:
+        rule_labels, model_labels = self.split_labels(labels)
+        entities, needs_model = self._fast_path(text, rule_labels, model_labels)
+        if needs_model:
+            entities = entities + self.batcher((text, model_labels))
+        return entities
+
+    async def predict_async(self, text: str, labels: Sequence[str]) -> List[Dict[str, Any]]:
+        rule_labels, model_labels = self.split_labels(labels)
+        entities, needs_model = self._fast_path(text, rule_labels, model_labels)
+        if needs_model:
+            entities = entities + await self.batcher.asubmit((text, model_labels))
+        return entities
@@ -0,0 +1,122 @@
+import re
+from typing import Any, Dict, List, Sequence
+
+# --------------- Deterministic PII detectors ---------------
+# Cheap, precompiled checks for PII with a fixed shape. Whatever is found here
+# never needs a GLiNER forward pass.
+
+_PHONE = re.compile(
+    r"(?<![\w+])(?:"
+    r"(?:(?:\+|00)91[\s-]?|0)?[6-9](?:[\s-]?\d){9}"           # mobile in any grouping: +91 98765 43210, 98 7654 3210
+    r"|1[\s-]?8\d{2}[\s-]?\d{3}[\s-]?\d{4}"                  # toll free: 1800-599-0019
+    r"|\(?0\d{2,4}\)?[\s-]?\d{3,4}[\s-]?\d{4}"               # landline with STD code: 022-27546669, (022) 2754 6669
+    r"|\+\d{1,3}(?:[\s.-]?\(?\d{1,4}\)?){2,5}"                 # other countries: +1 415 555 0199
+    r")(?!\w)"
+)
+_CARD = re.compile(r"(?<!\d)(?:\d[ -]?){12,18}\d(?!\d)")
+_AADHAAR = re.compile(r"(?<!\d)[2-9]\d{3}[ -]?\d{4}[ -]?\d{4}(?!\d)")
+_EMAIL = re.compile(r"(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 1:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+# Verhoeff tables, used by UIDAI for the Aadhaar check digit
+_VERHOEFF_D = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 2, 3, 4, 0, 6, 7, 8, 9, 5],
+    [2, 3, 4, 0, 1, 7, 8, 9, 5, 6], [3, 4, 0, 1, 2, 8, 9, 5, 6, 7],
+    [4, 0, 1, 2, 3, 9, 5, 6, 7, 8], [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+    [6, 5, 9, 8, 7, 1, 0, 4, 3, 2], [7, 6, 5, 9, 8, 2, 1, 0, 4, 3],
+    [8, 7, 6, 5, 9, 3, 2, 1, 0, 4], [9, 8, 7, 6, 5, 4, 3, 2, 1, 0],
+]
+_VERHOEFF_P = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 5, 7, 6, 2, 8, 3, 0, 9, 4],
+    [5, 8, 0, 3, 7, 9, 6, 1, 4, 2], [8, 9, 1, 6, 0, 4, 3, 5, 2, 7],
+    [9, 4, 5, 3, 1, 2, 6, 8, 7, 0], [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+    [2, 7, 9, 3, 8, 0, 6, 4, 1, 5], [7, 0, 4, 6, 9, 1, 3, 2, 5, 8],
+]
+
+def verhoeff_valid(digits: str) -> bool:
+    c = 0
+    for i, ch in enumerate(reversed(digits)):
+        c = _VERHOEFF_D[c][_VERHOEFF_P[i % 8][int(ch)]]
+    return c == 0
+
+def _digits(s: str) -> str:
+    return re.sub(r"\D", "", s)
+
+def _entity(match: re.Match, label: str) -> Dict[str, Any]:
+    return {"start": match.start(), "end": match.end(), "text": match.group(), "label": label, "score": 1.0, "source": "rule"}
+
+def detect_rule_entities(text: str, labels: Sequence[str]) -> List[Dict[str, Any]]:
+    entities = []
+    if "CreditCardNumber" in labels:
+        for m in _CARD.finditer(text):
+            if 13 <= len(_digits(m.group())) <= 19 and luhn_valid(_digits(m.group())):
+                entities.append(_entity(m, "CreditCardNumber"))
+    if "AadhaarNumber" in labels:
+        for m in _AADHAAR.finditer(text):
+            if verhoeff_valid(_digits(m.group())):
+                entities.append(_entity(m, "AadhaarNumber"))
+    if "PhoneNumber" in labels:
+        # E.164 allows at most 15 digits; fewer than 8 is a count or a year, not a number to call
+        entities.extend(_entity(m, "PhoneNumber") for m in _PHONE.finditer(text) if 8 <= len(_digits(m.group())) <= 15)
+    if "Email" in labels:
+        entities.extend(_entity(m, "Email") for m in _EMAIL.finditer(text))
+    return entities
+
+# Labels the detectors above look for: GLiNER is never asked for them, except
+# PhoneNumber, which no regex covers in every format. The model still gets it
+# whenever a run of digits is left over after the rules have run
+RULE_LABELS = frozenset({"PhoneNumber", "CreditCardNumber", "AadhaarNumber", "Email"})
+MODEL_FALLBACK_LABELS = frozenset({"PhoneNumber"})
+
+# --------------- Candidate heuristic for model labels ---------------
+# Common words that are never a name, place or organisation on their own. Chat is
+# often all lowercase, so case is not a signal: any word outside this list may be one.
+# Words that double as given names (will, may, hope, joy, ...) are deliberately left out.
+_STOP_WORDS = frozenset("""
+a about after again all also always am an and any anyone anything are aren't as at away back bad be because
+been before being better both but by can can't cannot could couldn't day days did didn't do does doesn't
+doing don't done down each else even ever every everyone everything feel feeling feels felt fine for from
+get gets getting go goes going good got had has hasn't have haven't having he he's hello help her here hey
+hi him his how i i'd i'll i'm i've if im in into is isn't it it's its just know last least less let like
+little lot lots make many me more most much must my myself need needs never new next no not nothing now of
+off ok okay on once one only or other our out over please really right same say see she she's should so
+some someone something sometimes sorry still such sure take tell than thank thanks that that's the their
+them then there these they they're thing things think this those through time to too try up us very want
+wanted was wasn't way we well were what when where which while who why with without won't would wouldn't
+yeah yes yet you you're your
+""".split())
+_TIME_WORDS = re.compile(
+    r"\d|\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|june?|july?|aug(?:ust)?|sept?(?:ember)?|"
+    r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"today|tonight|tomorrow|yesterday|morning|evening|night|weekend|o'clock)\b",
+    re.IGNORECASE,
+)
+_DIGIT_RUN = re.compile(r"\d(?:[\s().+-]{0,2}\d){5,}")
+_WORD = re.compile(r"[^\W\d_][\w'-]*")
+_HEURISTIC_LABELS = {"Person", "Organization", "Location", "DateTime", "PhoneNumber"}
+
+def has_model_candidates(text: str, labels: Sequence[str]) -> bool:
+    """Conservative pre-check: False only when the text is made of common words
+    alone (plus, for PhoneNumber, no digits the rules left unclaimed), so the
+    GLiNER call can be skipped."""
+    if any(label not in _HEURISTIC_LABELS for label in labels):
+        # No heuristic for custom labels, always ask the model
+        return True
+    if "DateTime" in labels and _TIME_WORDS.search(text):
+        return True
+    if "PhoneNumber" in labels and _DIGIT_RUN.search(text):
+        return True
+    if not any(label in labels for label in ("Person", "Organization", "Location")):
+        return False
+    # Non-Latin words are never in the stop list, so those always reach the model
+    return any(m.group().lower() not in _STOP_WORDS for m in _WORD.finditer(text))
@@ -1,217 +1,235 @@
-import torch
-from gliner import GLiNER
-from typing import List
-import torch.nn.functional as F
-from IndicTransToolkit.processor import IndicProcessor
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, AutoModelForSeq2SeqLM
+import asyncio
+import time
+from typing import Dict, List, Sequence
 
 import os
+import json
 from dotenv import load_dotenv
 load_dotenv()
 
-# torch.device("cuda" if torch.cuda.is_available() else "cpu")
+import metrics
+from emotion_engine import EmotionEngine
+from model_registry import registry
+from pii_engine import PIIEngine, PII_LABELS, anonymize_spans, entity_mapping
+from script_detect import needs_translation, skip_stats
+from translation_engine import TRANSLATION_BACKEND, cache_stats, translate, translate_async, translate_batch, translation_batcher
+
+# Nothing below loads a model or imports torch / transformers / GLiNER / IndicTransToolkit:
+# the engines fetch their models from the registry on first use, or all at once via warmup()
 
 DEVICE_FOR_EMOTION=os.getenv("DEVICE_FOR_EMOTION")
-DEVICE_FOR_INDIC_EN=os.getenv("DEVICE_FOR_INDIC_EN")
-DEVICE_FOR_EN_INDIC=os.getenv("DEVICE_FOR_EN_INDIC")
 
 # --------------- For Emotion Classification --------------- 
 TOP_N_EMOTION = int(os.getenv("TOP_N_EMOTION"))
 EMOTION_MODEL = os.getenv("EMOTION_MODEL")
-
-tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL)
-emotion_model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL)
-
-emotion_model.to(DEVICE_FOR_EMOTION)
-
-id2label = emotion_model.config.id2label
-
-def emotion_classification(user_input: str) -> str:
-
-    THRESHOLD_FOR_EMOTION = float(os.getenv("THRESHOLD_FOR_EMOTION"))
-    TEMPERATURE_FOR_EMOTION = float(os.getenv("TEMPERATURE_FOR_EMOTION"))
-
-    inputs = tokenizer(user_input, return_tensors="pt", truncation=True).to(DEVICE_FOR_EMOTION)
-
-    # Run inference
-    with torch.no_grad():
-        outputs = emotion_model(**inputs)
-        logits = outputs.logits/TEMPERATURE_FOR_EMOTION
-        probs = F.sigmoid(logits)[0].cpu().numpy()  # multi-label uses sigmoid
-
-    # Get all emotions with probabilities
-    results = {id2label[i]: float(probs[i]) for i in range(len(probs))}
-
-    # Sort by probability (descending)
-    sorted_results = dict(sorted(results.items(), key=lambda x: x[1], reverse=True))
-    filtered = {k: v for k, v in sorted_results.items() if v >= THRESHOLD_FOR_EMOTION}
-
+THRESHOLD_FOR_EMOTION = float(os.getenv("THRESHOLD_FOR_EMOTION"))
+TEMPERATURE_FOR_EMOTION = float(os.getenv("TEMPERATURE_FOR_EMOTION"))
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "torch")  # torch | int8 | onnx | onnx-int8
+
+emotion_engine = EmotionEngine(
+    EMOTION_MODEL,
+    DEVICE_FOR_EMOTION,
+    threshold=THRESHOLD_FOR_EMOTION,
+    temperature=TEMPERATURE_FOR_EMOTION,
+    top_n=TOP_N_EMOTION,
+    backend=EMOTION_BACKEND,
+)
+
+def __getattr__(name: str):
+    # Kept as a module attribute for old callers; reading it loads the emotion model
+    if name == "id2label":
+        return emotion_engine.id2label
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Optional: classify the original Indic input with a multilingual model while translation runs
+EMOTION_ON_SOURCE = os.getenv("EMOTION_ON_SOURCE", "0") == "1"
+MULTILINGUAL_EMOTION_MODEL = os.getenv("MULTILINGUAL_EMOTION_MODEL")
+if EMOTION_ON_SOURCE and not MULTILINGUAL_EMOTION_MODEL:
+    # Fail at startup, not on the first Indic message when the model is loaded
+    raise RuntimeError("EMOTION_ON_SOURCE=1 needs MULTILINGUAL_EMOTION_MODEL to be set")
+
+source_emotion_engine = EmotionEngine(
+    MULTILINGUAL_EMOTION_MODEL,
+    DEVICE_FOR_EMOTION,
+    threshold=float(os.getenv("THRESHOLD_FOR_MULTILINGUAL_EMOTION", str(THRESHOLD_FOR_EMOTION))),
+    temperature=TEMPERATURE_FOR_EMOTION,
+    top_n=TOP_N_EMOTION,
+    registry_key="emotion_multilingual",
+    activation=os.getenv("MULTILINGUAL_EMOTION_ACTIVATION", "sigmoid"),
+    map_onto=emotion_engine,
+    label_overrides=json.loads(os.getenv("EMOTION_LABEL_MAP", "{}")),
+    backend=EMOTION_BACKEND,
+)
+
+def emotion_scores(user_input: str) -> List[tuple]:
+    return emotion_engine.classify(user_input)
+
+def emotion_scores_batch(user_inputs: List[str]) -> List[List[tuple]]:
+    return emotion_engine.classify_batch(user_inputs)
+
+def format_emotions(scores: List[tuple]) -> str:
     emotions = ""
-    for emotion, score in list(filtered.items())[:TOP_N_EMOTION]:
+    for emotion, score in scores:
         emotions += '\n  ' + emotion
-
     return emotions
 
+def emotion_classification(user_input: str) -> str:
+    return format_emotions(emotion_scores(user_input))
+
+def emotion_classification_batch(user_inputs: List[str]) -> List[str]:
+    return [format_emotions(scores) for scores in emotion_scores_batch(user_inputs)]
+
 # --------------- Indic - to - Eng ---------------
-def indic_to_en(user_input: str, src_lang: str, tgt_lang: str) -> str:
-
-    INDIC_EN = os.getenv("INDIC_EN")
-    indic_en_tokenizer = AutoTokenizer.from_pretrained(INDIC_EN, trust_remote_code=True)
-
-    indic_en_model = AutoModelForSeq2SeqLM.from_pretrained(
-        INDIC_EN,
-        trust_remote_code=True,
-        dtype=torch.float16, # performance might slightly vary for bfloat16
-        attn_implementation="flash_attention_2"
-    ).to(DEVICE_FOR_INDIC_EN)
-
-    indic_en_ip = IndicProcessor(inference=True)
-
-    batch = indic_en_ip.preprocess_batch(
-        [user_input],
-        src_lang=src_lang,
-        tgt_lang=tgt_lang,
-    )
-
-    # Tokenize the sentences and generate input encodings
-    inputs = indic_en_tokenizer(
-        batch,
-        truncation=True,
-        padding="longest",
-        return_tensors="pt",
-        return_attention_mask=True,
-    ).to(DEVICE_FOR_INDIC_EN)
-
-    # Generate translations using the model
-    with torch.no_grad():
-        generated_tokens = indic_en_model.generate(
-            **inputs,
-            use_cache=False,
-            min_length=0,
-            max_length=256,
-            num_beams=5,
-            num_return_sequences=1,
-        )
-
-    # Decode the generated tokens into text
-    generated_tokens = indic_en_tokenizer.batch_decode(
-        generated_tokens,
-        skip_special_tokens=True,
-        clean_up_tokenization_spaces=True,
-    )
-
-    # Postprocess the translations, including entity replacement
-    translations = indic_en_ip.postprocess_batch(generated_tokens, lang=tgt_lang)
-
-    # Free GPU memory
-    del indic_en_model
-    del inputs
-    torch.cuda.empty_cache()
-
-    return str(translations[0])
+def indic_to_en(user_input: str, src_lang: str, tgt_lang: str, profile: str | None = None) -> str:
+    if not needs_translation(user_input, src_lang, tgt_lang):
+        return user_input
+    return translate(user_input, "indic_en", src_lang, tgt_lang, profile=profile)
+
+async def indic_to_en_async(user_input: str, src_lang: str, tgt_lang: str, profile: str | None = None) -> str:
+    if not needs_translation(user_input, src_lang, tgt_lang):
+        return user_input
+    return await translate_async(user_input, "indic_en", src_lang, tgt_lang, profile=profile)
 
 # --------------- Eng - to - Indic ---------------
-def en_to_indic(user_input: str, src_lang: str, tgt_lang: str) -> str:
-
-    EN_INDIC = os.getenv("EN_INDIC")
-    en_indic_tokenizer = AutoTokenizer.from_pretrained(EN_INDIC, trust_remote_code=True)
-
-    en_indic_model = AutoModelForSeq2SeqLM.from_pretrained(
-        EN_INDIC,
-        trust_remote_code=True,
-        dtype=torch.float16, # performance might slightly vary for bfloat16
-        attn_implementation="flash_attention_2"
-    ).to(DEVICE_FOR_EN_INDIC)
-
-    en_indic_ip = IndicProcessor(inference=True)
-
-    batch = en_indic_ip.preprocess_batch(
-        [user_input],
-        src_lang=src_lang,
-        tgt_lang=tgt_lang,
-    )
-
-    # Tokenize the sentences and generate input encodings
-    inputs = en_indic_tokenizer(
-        batch,
-        truncation=True,
-        padding="longest",
-        return_tensors="pt",
-        return_attention_mask=True,
-    ).to(DEVICE_FOR_EN_INDIC)
-
-    # Generate translations using the model
-    with torch.no_grad():
-        generated_tokens = en_indic_model.generate(
-            **inputs,
-            use_cache=False,
-            min_length=0,
-            max_length=256,
-            num_beams=5,
-            num_return_sequences=1,
-        )
-
-    # Decode the generated tokens into text
-    generated_tokens = en_indic_tokenizer.batch_decode(
-        generated_tokens,
-        skip_special_tokens=True,
-        clean_up_tokenization_spaces=True,
-    )
-
-    # Postprocess the translations, including entity replacement
-    translations = en_indic_ip.postprocess_batch(generated_tokens, lang=tgt_lang)
-
-    # Free GPU memory
-    del en_indic_model
-    del inputs
-    torch.cuda.empty_cache()
-
-    return str(translations[0])
+def en_to_indic(user_input: str, src_lang: str, tgt_lang: str, profile: str | None = None) -> str:
+    if not needs_translation(user_input, src_lang, tgt_lang):
+        return user_input
+    return translate(user_input, "en_indic", src_lang, tgt_lang, profile=profile)
+
+async def en_to_indic_async(user_input: str, src_lang: str, tgt_lang: str, profile: str | None = None) -> str:
+    if not needs_translation(user_input, src_lang, tgt_lang):
+        return user_input
+    return await translate_async(user_input, "en_indic", src_lang, tgt_lang, profile=profile)
 
 # --------------- PII Removal ---------------
 PII_REMOVAL_MODEL = os.getenv("PII_REMOVAL_MODEL")
 PII_REMOVAL_THRESHOLD = float(os.getenv("PII_REMOVAL_THRESHOLD"))
+PII_BACKEND = os.getenv("PII_BACKEND", "torch")  # torch | int8 | onnx | onnx-int8
 
-entity_mapping = {
-    "Person": "<PERSON>",
-    "Organization": "<ORGANIZATION>",
-    "Location": "<LOCATION>",
-    "DateTime": "<DATE_TIME>",
-    "PhoneNumber": "<PHONE_NUMBER>",
-    "CreditCardNumber": "<CREDIT_CARD_NUMBER>"
-}
 def anonymize_text(text: str, entities: List[dict]) -> str:
-    anonymized_text = text
-    for entity in entities:
-        anonymized_text = anonymized_text.replace(entity["text"], entity_mapping.get(entity["label"], f"<{entity['label']}>"))
+    anonymized_text, _ = anonymize_spans(text, entities)
     return anonymized_text
-def predict_entities_and_anonymize(text: str, labels: List[str]):
-    model = GLiNER.from_pretrained(PII_REMOVAL_MODEL)
-    entities = model.predict_entities(text, labels, threshold=PII_REMOVAL_THRESHOLD)
-    return anonymize_text(text, entities)
+
+pii_engine = PIIEngine(PII_REMOVAL_MODEL, PII_REMOVAL_THRESHOLD, backend=PII_BACKEND)
+
+def predict_entities_and_anonymize(text: str, labels: List[str], return_spans: bool = False):
+    entities = pii_engine.predict(text, labels)
+    anonymized_text, span_map = anonymize_spans(text, entities)
+    return (anonymized_text, span_map) if return_spans else anonymized_text
+
+def predict_entities_and_anonymize_batch(texts: List[str], labels: List[str], return_spans: bool = False) -> List:
+    batch_entities = pii_engine.predict_batch(texts, labels)
+    results = [anonymize_spans(text, entities) for text, entities in zip(texts, batch_entities)]
+    return results if return_spans else [anonymized_text for anonymized_text, _ in results]
 
 # --------------- Main Functions ---------------
-def pre_processing(user_input: str, src_lang: str, tgt_lang: str) -> str:
+def format_query(result: dict) -> str:
 
-    indic_en = indic_to_en(user_input, src_lang, tgt_lang)
-    
-    emotions = emotion_classification(indic_en)
-    
-    labels = ["Person", "Organization", "PhoneNumber", "CreditCardNumber", "Location", "DateTime"]  # Use "Location" for City and Country combined
-    pii_removed_text = predict_entities_and_anonymize(indic_en, labels)
-    
     new_query=f"""
     Query: 
-        {pii_removed_text}
+        {result["text"]}
 
     Emotions:
-        {emotions}
+        {format_emotions(result["emotions"])}
     """
 
     return new_query
 
+def pre_processing(user_input: str, src_lang: str, tgt_lang: str) -> str:
+
+    if EMOTION_ON_SOURCE:
+        # Queued before translation starts, so both run at the same time
+        source_emotions = source_emotion_engine.batcher.submit(user_input)
+
+    indic_en = indic_to_en(user_input, src_lang, tgt_lang)
+    
+    emotions = source_emotions.result() if EMOTION_ON_SOURCE else emotion_scores(indic_en)
+    
+    pii_removed_text = predict_entities_and_anonymize(indic_en, PII_LABELS)
+    
+    return format_query({"text": pii_removed_text, "emotions": emotions})
+
+async def pre_processing_async(user_input: str, src_lang: str, tgt_lang: str) -> dict:
+    """Same stages as pre_processing without blocking the event loop. Emotion
+    and PII detection both only need the English text, so they run together.
+    Returns text, emotions [(label, score)] and entity spans; format_query()
+    turns it into the prompt pre_processing builds."""
+    if EMOTION_ON_SOURCE:
+        with metrics.timer("pipeline.translate_ms"):
+            indic_en, emotions = await asyncio.gather(
+                indic_to_en_async(user_input, src_lang, tgt_lang),
+                source_emotion_engine.classify_async(user_input),
+            )
+        with metrics.timer("pipeline.analyse_ms"):
+            entities = await pii_engine.predict_async(indic_en, PII_LABELS)
+    else:
+        with metrics.timer("pipeline.translate_ms"):
+            indic_en = await indic_to_en_async(user_input, src_lang, tgt_lang)
+
+        with metrics.timer("pipeline.analyse_ms"):
+            emotions, entities = await asyncio.gather(
+                emotion_engine.classify_async(indic_en),
+                pii_engine.predict_async(indic_en, PII_LABELS),
+            )
+
+    pii_removed_text, span_map = anonymize_spans(indic_en, entities)
+
+    return {
+        "text": pii_removed_text,
+        "english": indic_en,
+        "emotions": emotions,
+        "entities": span_map,
+        "src_lang": src_lang,
+        "tgt_lang": tgt_lang,
+    }
+
 def post_processing(ai_output: str, src_lang: str, tgt_lang: str) -> str:
 
     en_indic = en_to_indic(ai_output, src_lang, tgt_lang)
     
-    return en_indic
\ No newline at end of file
+    return en_indic
+
+async def post_processing_async(ai_output: str, src_lang: str, tgt_lang: str) -> str:
+    return await en_to_indic_async(ai_output, src_lang, tgt_lang)
+
+# --------------- Warm-up ---------------
+# Comma-separated subset of: emotion, pii, translation
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "emotion,pii,translation")
+WARMUP_LANG = os.getenv("WARMUP_LANG", "hin_Deva")
+
+def warmup(models: Sequence[str] | None = None, lang: str = WARMUP_LANG) -> Dict[str, float]:
+    """Loads the selected models and runs one dummy inference through each, so
+    the first real chat does not pay for it. Returns milliseconds per model."""
+    models = [m.strip() for m in WARMUP_MODELS.split(",") if m.strip()] if models is None else list(models)
+    timings = {}
+    for name in models:
+        t0 = time.perf_counter()
+        if name == "emotion":
+            emotion_engine.classify_batch(["I feel a little nervous about my exams."])
+            if EMOTION_ON_SOURCE:
+                source_emotion_engine.classify_batch(["I feel a little nervous about my exams."])
+        elif name == "pii":
+            model_labels = pii_engine.split_labels(PII_LABELS)[1]
+            pii_engine.precompute_labels(model_labels)
+            pii_engine.model_predict_batch(["My name is Arjun and I study in Chennai."], model_labels)
+        elif name == "translation":
+            # Straight to the model: the cache and script checks would skip a repeated dummy sentence
+            english = translate_batch(["How are you feeling today?"], "en_indic", "eng_Latn", lang, TRANSLATION_BACKEND)
+            translate_batch(english, "indic_en", lang, "eng_Latn", TRANSLATION_BACKEND)
+        else:
+            raise ValueError(f"Unknown warm-up model '{name}', expected emotion, pii or translation")
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+        metrics.observe(f"warmup.{name}_ms", timings[name])
+    return timings
+
+def model_stats() -> dict:
+    # Load/evict events and resident size of every gateway model
+    return registry.stats()
+
+def translation_stats() -> dict:
+    # Batch sizes and queue waits of the translation batcher, plus cache hit ratio and size
+    return {**translation_batcher.stats(), "cache": cache_stats(), "skips": skip_stats()}
+
+def pii_stats() -> dict:
+    # Batch sizes and queue waits of the shared PII batcher
+    return pii_engine.batcher.stats()
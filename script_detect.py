@@ -0,0 +1,101 @@
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict
+
+import metrics
+
+# --------------- Script and language checks ahead of translation ---------------
+# What to do with Indic languages typed in Latin letters ("naan romba sad ah irukken")
+# and with messages that mix a native script and Latin: "translate" or "passthrough"
+ROMANISED_INPUT_POLICY = os.getenv("ROMANISED_INPUT_POLICY", "passthrough")
+MIXED_SCRIPT_POLICY = os.getenv("MIXED_SCRIPT_POLICY", "translate")
+# Share of letters in one script above which the text counts as written in it
+SCRIPT_DOMINANCE = float(os.getenv("SCRIPT_DOMINANCE", "0.85"))
+
+# FLORES script codes used by IndicTrans2 -> prefix of the Unicode character names
+_SCRIPT_NAMES = {
+    "Latn": "LATIN", "Deva": "DEVANAGARI", "Beng": "BENGALI", "Guru": "GURMUKHI", "Gujr": "GUJARATI",
+    "Orya": "ORIYA", "Taml": "TAMIL", "Telu": "TELUGU", "Knda": "KANNADA", "Mlym": "MALAYALAM",
+    "Arab": "ARABIC", "Olck": "OL CHIKI", "Mtei": "MEETEI MAYEK",
+}
+_NAME_TO_CODE = {name: code for code, name in _SCRIPT_NAMES.items()}
+
+_ENGLISH_WORDS = frozenset(
+    "i me my you your he she it we they them the a an and or but if so to of in on at for with from by "
+    "is am are was were be been being have has had do does did not no yes can could will would should "
+    "what why how when where who this that these those there here feel feeling very really just about "
+    "help need want know think dont don't im i'm it's please thanks hi hello hey sad happy stress exam".split()
+)
+_WORD = re.compile(r"[a-zA-Z']+")
+
+def _char_script(ch: str) -> str:
+    if ch.isascii():
+        return "Latn"
+    name = unicodedata.name(ch, "")
+    for prefix, code in _NAME_TO_CODE.items():
+        if name.startswith(prefix):
+            return code
+    return "Other"
+
+def script_counts(text: str) -> Counter:
+    return Counter(_char_script(ch) for ch in text if ch.isalpha())
+
+def lang_script(lang: str) -> str:
+    return lang.rsplit("_", 1)[-1]
+
+def english_ratio(text: str) -> float:
+    words = [w.lower() for w in _WORD.findall(text)]
+    return sum(w in _ENGLISH_WORDS for w in words) / len(words) if words else 0.0
+
+def classify_input(text: str, src_lang: str) -> str:
+    """One of: "native" (written in src_lang's script), "english", "romanised",
+    "mixed" or "empty" (no letters at all)."""
+    counts = script_counts(text)
+    letters = sum(counts.values())
+    if not letters:
+        return "empty"
+    native = counts.get(lang_script(src_lang), 0) / letters
+    latin = counts.get("Latn", 0) / letters
+    if lang_script(src_lang) == "Latn" or latin >= SCRIPT_DOMINANCE:
+        return "english" if english_ratio(text) >= 0.3 else "romanised"
+    if native >= SCRIPT_DOMINANCE:
+        return "native"
+    return "mixed"
+
+def needs_translation(text: str, src_lang: str, tgt_lang: str) -> bool:
+    """Cheap up-front check; False means the text can be passed through as is.
+    Skips are counted under translation.skipped.<reason>."""
+    reason = None
+    if src_lang == tgt_lang:
+        reason = "same_lang"
+    elif src_lang == "eng_Latn":
+        # Outgoing replies: already in the target script (e.g. the model answered in Tamil)
+        counts = script_counts(text)
+        letters = sum(counts.values())
+        if not letters:
+            reason = "no_letters"
+        elif counts.get(lang_script(tgt_lang), 0) / letters >= SCRIPT_DOMINANCE and lang_script(tgt_lang) != "Latn":
+            reason = "already_target_script"
+    else:
+        kind = classify_input(text, src_lang)
+        if kind == "empty":
+            reason = "no_letters"
+        elif kind == "english" and tgt_lang == "eng_Latn":
+            reason = "english_input"
+        elif kind == "romanised" and ROMANISED_INPUT_POLICY == "passthrough":
+            reason = "romanised"
+        elif kind == "mixed" and MIXED_SCRIPT_POLICY == "passthrough":
+            reason = "mixed_script"
+
+    if reason:
+        metrics.incr(f"translation.skipped.{reason}")
+        metrics.incr("translation.skipped.chars", len(text))
+        return False
+    metrics.incr("translation.required")
+    return True
+
+def skip_stats() -> Dict[str, float]:
+    counters = metrics.snapshot(prefix="translation.")["counters"]
+    return {k: v for k, v in counters.items() if k.startswith(("translation.skipped", "translation.required"))}
@@ -11,8 +11,7 @@ const surveyRoutes = require('./routes/surveys');
 const counselorsRoutes = require('./routes/counselors');
 const appointmentsRoutes = require('./routes/appointments');
 const db = require('./db');
-const { spawn } = require('child_process');
-const path = require('path');
+const axios = require('axios');
 
 const app = express();
 const httpServer = createServer(app);
@@ -74,54 +73,75 @@ app.use('/api/counselors', counselorsRoutes);
 app.use('/api/appointments', appointmentsRoutes);
 
 // AI Chat endpoint
+// Forwarded to the long-lived Python chat service (chat_service.py), which keeps the
+// agent, MCP tools and models loaded between requests
+const CHAT_SERVICE_URL = process.env.CHAT_SERVICE_URL || 'http://127.0.0.1:8100';
+const CHAT_SERVICE_TIMEOUT_MS = Number(process.env.CHAT_SERVICE_TIMEOUT_MS || 180000);
+
 app.post('/chat', async (req, res) => {
   try {
-    const { message, language = 'tam_Taml' } = req.body;
+    const { message, language = 'tam_Taml', sessionId, session_id } = req.body;
     
     if (!message) {
       return res.status(400).json({ error: 'Message is required' });
     }
 
-    // Path to the MCP client script
-    const mcpClientPath = path.join(__dirname, '..', 'SIH_2025', 'mcp_client_remote.py');
-    
-    // Spawn Python process to run MCP client
-    const pythonProcess = spawn('python', [mcpClientPath, message, language], {
-      cwd: path.join(__dirname, '..', 'SIH_2025')
-    });
+    const { data } = await axios.post(
+      `${CHAT_SERVICE_URL}/chat`,
+      { message, language, session_id: session_id || sessionId },
+      { timeout: CHAT_SERVICE_TIMEOUT_MS }
+    );
 
-    let responseData = '';
-    let errorData = '';
+    res.json({ response: data.response, session_id: data.session_id });
 
-    pythonProcess.stdout.on('data', (data) => {
-      responseData += data.toString();
-    });
+  } catch (error) {
+    if (error.response) {
+      // The chat service answered with an error of its own (bad input, failed turn)
+      console.error('Chat service error:', error.response.data);
+      return res.status(error.response.status).json({ error: error.response.data.error || 'Failed to get AI response' });
+    }
+    console.error('Chat endpoint error:', error.message);
+    res.status(503).json({ error: 'Failed to reach AI service' });
+  }
+});
 
-    pythonProcess.stderr.on('data', (data) => {
-      errorData += data.toString();
-    });
+// Same body as /chat; relays the chat service's NDJSON stream ({"type": "token"} lines
+// while the reply is generated, then one "done" or "error" line) as it arrives
+app.post('/chat/stream', async (req, res) => {
+  const { message, language = 'tam_Taml', sessionId, session_id } = req.body;
 
-    pythonProcess.on('close', (code) => {
-      if (code === 0) {
-        // Extract the response from the output
-        const responseMatch = responseData.match(/Response:(.*?)(?:\n\n\n|$)/s);
-        const response = responseMatch ? responseMatch[1].trim() : responseData.trim();
-        
-        res.json({ response });
-      } else {
-        console.error('Python process error:', errorData);
-        res.status(500).json({ error: 'Failed to get AI response' });
-      }
-    });
+  if (!message) {
+    return res.status(400).json({ error: 'Message is required' });
+  }
 
-    pythonProcess.on('error', (error) => {
-      console.error('Failed to start Python process:', error);
-      res.status(500).json({ error: 'Failed to start AI service' });
+  try {
+    const upstream = await axios.post(
+      `${CHAT_SERVICE_URL}/chat/stream`,
+      { message, language, session_id: session_id || sessionId },
+      { timeout: CHAT_SERVICE_TIMEOUT_MS, responseType: 'stream' }
+    );
+
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    // A chat service that dies mid-reply ends the stream with a final error line (the leading
+    // newline closes any half-sent line) instead of an unhandled 'error' crashing the server
+    upstream.data.on('error', (err) => {
+      console.error('Chat stream relay error:', err.message);
+      if (!res.writableEnded) {
+        res.end('\n' + JSON.stringify({ type: 'error', error: 'AI service connection lost' }) + '\n');
+      }
     });
+    upstream.data.pipe(res);
+    // Stop relaying if the browser goes away; the chat service still finishes the turn
+    res.on('close', () => upstream.data.destroy());
 
   } catch (error) {
-    console.error('Chat endpoint error:', error);
-    res.status(500).json({ error: 'Internal server error' });
+    if (error.response) {
+      console.error('Chat service stream error:', error.response.status);
+      return res.status(error.response.status).json({ error: 'Failed to get AI response' });
+    }
+    console.error('Chat stream endpoint error:', error.message);
+    res.status(503).json({ error: 'Failed to reach AI service' });
   }
 });
 
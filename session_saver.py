@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+import metrics
+
+# --------------- Bounded in-memory conversation history ---------------
+# Sessions idle for longer than this are forgotten; 0 keeps them until the cap pushes them out
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "3600"))
+# Most sessions kept at once; the least recently used one goes first
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+
+class BoundedSessionSaver(InMemorySaver):
+    """InMemorySaver for a long-lived process: every checkpoint read or write
+    touches its thread (session), and threads idle past `ttl_s` or beyond the
+    `max_sessions` most recently used are deleted with all their history."""
+
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_sessions: int = SESSION_MAX, **kwargs):
+        super().__init__(**kwargs)
+        self.ttl_s = ttl_s
+        self.max_sessions = max(1, max_sessions)
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def _touch(self, config) -> None:
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return
+        now = time.monotonic()
+        with self._sessions_lock:
+            self._last_used[str(thread_id)] = now
+            self._last_used.move_to_end(str(thread_id))
+            expired = []
+            for tid, used in self._last_used.items():
+                if tid == str(thread_id):
+                    break
+                if len(self._last_used) - len(expired) > self.max_sessions or (self.ttl_s and now - used > self.ttl_s):
+                    expired.append(tid)
+                else:
+                    # Oldest first: once one is young enough and under the cap, so are the rest
+                    break
+            for tid in expired:
+                del self._last_used[tid]
+            metrics.set_gauge("chat.sessions", len(self._last_used))
+        for tid in expired:
+            self._forget(tid)
+        if expired:
+            metrics.incr("chat.sessions_evicted", len(expired))
+
+    def _forget(self, thread_id: str) -> None:
+        if hasattr(InMemorySaver, "delete_thread"):
+            super().delete_thread(thread_id)
+            return
+        # Older langgraph-checkpoint: drop the thread from the saver's own tables
+        self.storage.pop(thread_id, None)
+        for table in (self.writes, self.blobs):
+            for key in [k for k in table if k[0] == thread_id]:
+                del table[key]
+
+    def get_tuple(self, config):
+        self._touch(config)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._touch(config)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._sessions_lock:
+            self._last_used.pop(str(thread_id), None)
+        self._forget(str(thread_id))
@@ -0,0 +1,30 @@
+import pytest
+
+from counsellor_index import DAY, WEEK, parse_day, parse_schedule
+
+# --------------- One weekday ---------------
+@pytest.mark.parametrize("text, ranges", [
+    ("09:00-12:00", [(540, 720)]),
+    ("09:00-12:00, 14:00-17:00", [(540, 720), (840, 1020)]),
+    ("9am - 1:30pm", [(540, 810)]),
+    ("9-1pm", [(540, 780)]),
+    ("1-5pm", [(780, 1020)]),
+    ("10-2am", [(1320, 1560)]),
+    ("21:00-02:00", [(1260, 1560)]),
+    ("12-3pm", [(720, 900)]),
+    ("Off", []),
+    ("", []),
+])
+def test_parse_day(text, ranges):
+    assert parse_day(text) == ranges
+
+# --------------- Whole week ---------------
+def test_parse_schedule_merges_and_offsets_by_weekday():
+    schedule = {"Monday": "09:00-12:00, 11:00-13:00", "tuesday": "Off", "Wednesday": "14:00-15:00"}
+    assert parse_schedule(schedule) == [(540, 780), (2 * DAY + 840, 2 * DAY + 900)]
+
+def test_parse_schedule_sunday_night_wraps_to_monday():
+    assert parse_schedule('{"sunday": "22:00-02:00"}') == [(0, 120), (6 * DAY + 1320, WEEK)]
+
+def test_parse_schedule_skips_unknown_weekdays():
+    assert parse_schedule({"someday": "09:00-10:00"}) == []
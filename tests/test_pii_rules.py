@@ -0,0 +1,103 @@
+import pytest
+
+from pii_rules import (
+    MODEL_FALLBACK_LABELS,
+    RULE_LABELS,
+    detect_rule_entities,
+    has_model_candidates,
+    luhn_valid,
+    verhoeff_valid,
+)
+
+ALL_LABELS = ("Person", "Organization", "PhoneNumber", "CreditCardNumber", "Location", "DateTime", "AadhaarNumber", "Email")
+MODEL_LABELS = tuple(l for l in ALL_LABELS if l not in RULE_LABELS or l in MODEL_FALLBACK_LABELS)
+
+def found(text, label):
+    return [e["text"] for e in detect_rule_entities(text, (label,))]
+
+# --------------- Check digits ---------------
+@pytest.mark.parametrize("digits, valid", [
+    ("4111111111111111", True),
+    ("4111111111111112", False),
+    ("79927398713", True),
+    ("79927398710", False),
+])
+def test_luhn(digits, valid):
+    assert luhn_valid(digits) is valid
+
+@pytest.mark.parametrize("digits, valid", [
+    ("2363", True),
+    ("2364", False),
+    ("234123412346", True),
+    ("234123412347", False),
+    ("499187332147", True),
+])
+def test_verhoeff(digits, valid):
+    assert verhoeff_valid(digits) is valid
+
+# --------------- Detectors ---------------
+@pytest.mark.parametrize("number", [
+    "+91 98765 43210",
+    "09876543210",
+    "9876543210",
+    "98 7654 3210",
+    "9876 543 210",
+    "1800-599-0019",
+    "022-27546669",
+    "(022) 2754 6669",
+    "+1 415 555 0199",
+])
+def test_phone_formats(number):
+    assert found(f"call me on {number} tonight", "PhoneNumber") == [number]
+
+@pytest.mark.parametrize("text", [
+    "I slept 8 hours",
+    "it happened in 2023",
+    "room 12345",
+])
+def test_phone_ignores_short_numbers(text):
+    assert found(text, "PhoneNumber") == []
+
+def test_card_requires_luhn():
+    assert found("card 4111 1111 1111 1111 please", "CreditCardNumber") == ["4111 1111 1111 1111"]
+    assert found("card 4111 1111 1111 1112 please", "CreditCardNumber") == []
+
+def test_aadhaar_requires_verhoeff():
+    assert found("aadhaar 2341 2341 2346", "AadhaarNumber") == ["2341 2341 2346"]
+    assert found("aadhaar 2341 2341 2347", "AadhaarNumber") == []
+
+def test_email():
+    assert found("write to priya.k+sih@college.ac.in today", "Email") == ["priya.k+sih@college.ac.in"]
+
+def test_only_requested_labels():
+    assert detect_rule_entities("mail a@b.com or call 9876543210", ("Email",))[0]["label"] == "Email"
+    assert len(detect_rule_entities("mail a@b.com or call 9876543210", ("Email",))) == 1
+
+# --------------- Candidate heuristic ---------------
+@pytest.mark.parametrize("text", [
+    "my friend priya from chennai",
+    "i hate rahul he keeps bullying me",
+    "I study at IIT Madras",
+    "see you on monday",
+    "reach me at 98 7654 3210",
+    "நான் சென்னையில் இருக்கிறேன்",
+])
+def test_candidates_found(text):
+    assert has_model_candidates(text, MODEL_LABELS)
+
+@pytest.mark.parametrize("text", [
+    "hi",
+    "thank you so much",
+    "I feel really bad and I don't know what to do",
+    "",
+])
+def test_candidates_skipped(text):
+    assert not has_model_candidates(text, MODEL_LABELS)
+
+def test_phone_stays_a_model_label():
+    assert "PhoneNumber" in MODEL_LABELS
+    assert has_model_candidates("number is 98 76 54 32 10", ("PhoneNumber",))
+    assert not has_model_candidates("no digits here", ("PhoneNumber",))
+
+def test_custom_labels_always_go_to_the_model():
+    assert has_model_candidates("hi", ("Person", "MedicalCondition"))
@@ -0,0 +1,45 @@
+import pytest
+
+from translation_engine import _Plan, split_segments
+
+TEXTS = [
+    "Please see Dr. Rao tomorrow. Take care.",
+    "Try calming things, e.g. breathing. It helps.",
+    "Take a **short** walk outside. Rest well.",
+    "**Stay calm.** You are not alone.",
+    "**Tips:** drink water.",
+    "- Breathe slowly.\n- Call 14416.\n\n1. Sleep early.",
+    "You matter 💙  Call 14416 anytime!",
+    "",
+]
+
+def translatable(text):
+    return [piece for piece, is_text in split_segments(text) if is_text]
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_pieces_join_back_to_input(text):
+    assert "".join(piece for piece, _ in split_segments(text)) == text
+
+@pytest.mark.parametrize("text, sentences", [
+    ("Please see Dr. Rao tomorrow. Take care.", ["Please see Dr. Rao tomorrow.", "Take care."]),
+    ("Try calming things, e.g. breathing. It helps.", ["Try calming things, e.g. breathing.", "It helps."]),
+    ("Meet at 5 p.m. today. Bring water.", ["Meet at 5 p.m. today.", "Bring water."]),
+    ("**Stay calm.** You are not alone.", ["Stay calm.", "You are not alone."]),
+    ("- Breathe slowly.\n- Call 14416.", ["Breathe slowly.", "Call 14416."]),
+])
+def test_sentence_boundaries(text, sentences):
+    assert translatable(text) == sentences
+
+def test_inline_bold_reaches_the_model_as_one_sentence():
+    text = "Take a **short** walk outside. Rest well."
+    assert translatable(text) == ["Take a **short** walk outside.", "Rest well."]
+    plan = _Plan(text, "en_indic", "eng_Latn", "hin_Deva", backend=None, profile=None)
+    assert sorted(plan.sources.values()) == ["Rest well.", "Take a short walk outside."]
+
+def test_long_sentence_is_split_under_the_word_limit(monkeypatch):
+    import translation_engine
+
+    monkeypatch.setattr(translation_engine, "SEGMENT_MAX_WORDS", 5)
+    text = "One two three, four five six, seven eight nine ten eleven twelve."
+    assert "".join(piece for piece, _ in split_segments(text)) == text
+    assert all(len(piece.split()) <= 5 for piece in translatable(text))
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import metrics
+
+TRANSLATION_CACHE = os.getenv("TRANSLATION_CACHE", "1") == "1"
+TRANSLATION_CACHE_MEMORY_MB = float(os.getenv("TRANSLATION_CACHE_MEMORY_MB", "64"))
+# Empty string keeps the cache in memory only
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", os.path.join(".model_cache", "translations.sqlite"))
+
+def normalise(text: str) -> str:
+    return " ".join(text.split())
+
+def cache_key(text: str, src_lang: str, tgt_lang: str, revision: str, profile: str) -> str:
+    # Content-addressed: anything that can change the output is part of the key
+    raw = "\x1f".join((normalise(text), src_lang, tgt_lang, revision, profile))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class TranslationCache:
+    """In-memory LRU in front of a persistent SQLite table. Values are whole
+    translated segments; lookups and stores are batched per reply."""
+
+    def __init__(self, memory_mb: float = TRANSLATION_CACHE_MEMORY_MB, path: Optional[str] = TRANSLATION_CACHE_PATH):
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.path = path or None
+        self._db = None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    # ---- Memory tier ----
+    def _remember(self, key: str, value: str) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = value
+        self._memory_bytes += len(value.encode("utf-8")) + len(key)
+        while self._memory_bytes > self.memory_budget and self._memory:
+            old_key, old_value = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_value.encode("utf-8")) + len(old_key)
+            metrics.incr("translation_cache.memory_evictions")
+
+    # ---- Public API ----
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            metrics.incr("translation_cache.memory_hits", len(found))
+
+            missing = [key for key in keys if key not in found]
+            if missing and self._db is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(f"SELECT key, value FROM translations WHERE key IN ({placeholders})", missing).fetchall()
+                for key, value in rows:
+                    found[key] = value
+                    self._remember(key, value)
+                metrics.incr("translation_cache.disk_hits", len(rows))
+
+        metrics.incr("translation_cache.misses", len(keys) - len(found))
+        return found
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value)
+            if self._db is not None:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO translations (key, value, created_at) VALUES (?, ?, ?)",
+                    [(key, value, now) for key, value in items.items()],
+                )
+                self._db.commit()
+        metrics.incr("translation_cache.stores", len(items))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        counters = metrics.snapshot(prefix="translation_cache.")["counters"]
+        hits = counters.get("translation_cache.memory_hits", 0) + counters.get("translation_cache.disk_hits", 0)
+        lookups = hits + counters.get("translation_cache.misses", 0)
+        with self._lock:
+            entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] if self._db is not None else 0
+        disk_bytes = sum(os.path.getsize(p) for p in (self.path, f"{self.path}-wal") if p and os.path.exists(p)) if self.path else 0
+        return {
+            **counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": entries,
+            "memory_bytes": memory_bytes,
+            "disk_entries": disk_entries,
+            "disk_bytes": disk_bytes,
+        }
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from functools import partial
+from typing import Dict, List
+
+import metrics
+from batching import MicroBatcher
+from inference_backends import configure_threads, quantize_int8
+from model_registry import registry
+from translation_cache import TRANSLATION_CACHE, TranslationCache, cache_key
+
+# --------------- Translation backends ---------------
+# "fp16"     : the original setup, fp16 + flash attention on DEVICE_FOR_INDIC_EN / DEVICE_FOR_EN_INDIC
+# "cpu-fp32" : fp32 weights on CPU with SDPA attention
+# "cpu-int8" : dynamic int8 nn.Linear weights on CPU (CPU_THREADS sets torch's thread count)
+# Both CPU backends decode with the KV cache.
+TRANSLATION_BACKENDS = ("fp16", "cpu-fp32", "cpu-int8")
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "fp16")
+
+TRANSLATION_MODELS = {
+    "indic_en": os.getenv("INDIC_EN"),
+    "en_indic": os.getenv("EN_INDIC"),
+}
+
+TRANSLATION_DEVICES = {
+    "indic_en": os.getenv("DEVICE_FOR_INDIC_EN"),
+    "en_indic": os.getenv("DEVICE_FOR_EN_INDIC"),
+}
+
+# --------------- Generation profiles ---------------
+# "quality" is the original beam search; "fast" decodes with the KV cache, uses
+# greedy search for short inputs and sizes max_length from the input length.
+GENERATION_PROFILES = {
+    "quality": {"use_cache": False, "num_beams": 5, "max_length": 256},
+    "fast": {"use_cache": True, "num_beams": 2, "short_num_beams": 1, "short_input_tokens": 24,
+             "max_length_ratio": 1.6, "max_length_slack": 16, "max_length": 256},
+}
+TRANSLATION_PROFILE = os.getenv("TRANSLATION_PROFILE", "quality")
+# Per language pair overrides, e.g. {"eng_Latn-tam_Taml": "fast"}
+TRANSLATION_PROFILE_OVERRIDES = json.loads(os.getenv("TRANSLATION_PROFILE_OVERRIDES", "{}"))
+
+def resolve_profile(src_lang: str, tgt_lang: str, profile: str | None = None) -> str:
+    name = profile or TRANSLATION_PROFILE_OVERRIDES.get(f"{src_lang}-{tgt_lang}", TRANSLATION_PROFILE)
+    if name not in GENERATION_PROFILES:
+        raise ValueError(f"Unknown generation profile '{name}', expected one of {tuple(GENERATION_PROFILES)}")
+    return name
+
+def generation_kwargs(profile: str, backend: str, input_tokens: int) -> dict:
+    settings = GENERATION_PROFILES[profile]
+    num_beams = settings["num_beams"]
+    if input_tokens <= settings.get("short_input_tokens", 0):
+        num_beams = settings["short_num_beams"]
+    max_length = settings["max_length"]
+    if "max_length_ratio" in settings:
+        max_length = min(max_length, int(input_tokens * settings["max_length_ratio"]) + settings["max_length_slack"])
+    return {
+        # The CPU backends always decode with the KV cache
+        "use_cache": settings["use_cache"] or backend != "fp16",
+        "min_length": 0,
+        "max_length": max_length,
+        "num_beams": num_beams,
+        "num_return_sequences": 1,
+    }
+
+TRANSLATION_MAX_BATCH_SIZE = int(os.getenv("TRANSLATION_MAX_BATCH_SIZE", "16"))
+TRANSLATION_MAX_WAIT_MS = float(os.getenv("TRANSLATION_MAX_WAIT_MS", "5"))
+
+def translation_device(direction: str, backend: str) -> str:
+    return TRANSLATION_DEVICES[direction] if backend == "fp16" else "cpu"
+
+def load_translation_model(direction: str, backend: str):
+    import torch
+    from IndicTransToolkit.processor import IndicProcessor
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    if backend not in TRANSLATION_BACKENDS:
+        raise ValueError(f"Unknown translation backend '{backend}', expected one of {TRANSLATION_BACKENDS}")
+
+    model_name = TRANSLATION_MODELS[direction]
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+
+    if backend == "fp16":
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            dtype=torch.float16, # performance might slightly vary for bfloat16
+            attn_implementation="flash_attention_2"
+        ).to(translation_device(direction, backend))
+    else:
+        configure_threads()
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            dtype=torch.float32,
+            attn_implementation="sdpa"
+        )
+        if backend == "cpu-int8":
+            # Remote-code model classes do not unpickle reliably, so quantize at load instead of caching
+            model = quantize_int8(model, model_name, cache=False)
+    model.eval()
+
+    return tokenizer, model, IndicProcessor(inference=True)
+
+for _direction in TRANSLATION_MODELS:
+    for _backend in TRANSLATION_BACKENDS:
+        registry.register(f"{_direction}:{_backend}", partial(load_translation_model, _direction, _backend))
+
+def translate_batch(texts: List[str], direction: str, src_lang: str, tgt_lang: str, backend: str = TRANSLATION_BACKEND,
+                    profile: str | None = None) -> List[str]:
+    import torch
+
+    profile = resolve_profile(src_lang, tgt_lang, profile)
+    t0 = time.perf_counter()
+
+    device = translation_device(direction, backend)
+    with registry.use(f"{direction}:{backend}") as (tokenizer, model, ip):
+        batch = ip.preprocess_batch(
+            texts,
+            src_lang=src_lang,
+            tgt_lang=tgt_lang,
+        )
+
+        # Tokenize the sentences and generate input encodings
+        inputs = tokenizer(
+            batch,
+            truncation=True,
+            padding="longest",
+            return_tensors="pt",
+            return_attention_mask=True,
+        ).to(device)
+
+        # Generate translations using the model
+        with torch.no_grad():
+            generated_tokens = model.generate(
+                **inputs,
+                **generation_kwargs(profile, backend, inputs["input_ids"].shape[1]),
+            )
+
+        # Decode the generated tokens into text
+        generated_tokens = tokenizer.batch_decode(
+            generated_tokens,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=True,
+        )
+
+        # Postprocess the translations, including entity replacement
+        translations = ip.postprocess_batch(generated_tokens, lang=tgt_lang)
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    metrics.observe(f"translation.profile.{profile}.batch_ms", elapsed_ms)
+    metrics.observe(f"translation.profile.{profile}.per_text_ms", elapsed_ms / len(texts))
+
+    return [str(t) for t in translations]
+
+# --------------- Micro-batching front end ---------------
+def _length_bucket(text: str) -> int:
+    # Whitespace words approximate subword tokens well enough to keep padding low;
+    # segments are short, so buckets are 4 words wide up to 64 words
+    return min(len(text.split()) // 4, 16)
+
+def _translation_key(request: tuple):
+    direction, user_input, src_lang, tgt_lang, backend, profile = request
+    return direction, backend, profile, src_lang, tgt_lang, _length_bucket(user_input)
+
+def _translate_group(key: tuple, requests: List[tuple]) -> List[str]:
+    direction, backend, profile, src_lang, tgt_lang, _ = key
+    return translate_batch([request[1] for request in requests], direction, src_lang, tgt_lang, backend, profile)
+
+# One generate() per (direction, backend, profile, language pair, length bucket) across all concurrent chats
+translation_batcher = MicroBatcher(
+    _translate_group,
+    key_fn=_translation_key,
+    max_batch_size=TRANSLATION_MAX_BATCH_SIZE,
+    max_wait_ms=TRANSLATION_MAX_WAIT_MS,
+    name="translation",
+)
+
+def _request(user_input: str, direction: str, src_lang: str, tgt_lang: str, backend: str, profile: str) -> tuple:
+    return direction, user_input, src_lang, tgt_lang, backend, profile
+
+# --------------- Segmented, cached translation ---------------
+TRANSLATION_MODEL_REVISION = os.getenv("TRANSLATION_MODEL_REVISION", "main")
+
+# Opened on first use, so importing the gateway creates no files
+_translation_cache: TranslationCache | None = None
+_translation_cache_lock = threading.Lock()
+
+def get_translation_cache() -> TranslationCache | None:
+    global _translation_cache
+    if not TRANSLATION_CACHE:
+        return None
+    with _translation_cache_lock:
+        if _translation_cache is None:
+            _translation_cache = TranslationCache()
+    return _translation_cache
+
+# Only bot replies are cached. indic_en input is the raw student message, before PII
+# removal, and must never be written to the cache's SQLite file
+CACHED_DIRECTIONS = ("en_indic",)
+
+# Longest segment sent to the model; ~1.5 subwords per word keeps it well under 256 tokens
+SEGMENT_MAX_WORDS = int(os.getenv("SEGMENT_MAX_WORDS", "60"))
+
+# Layout that is copied through untranslated: newlines, list markers / headings at line start
+_LAYOUT = re.compile(r"(\n|^[ \t]*(?:[-*\u2022]|\d+[.)]|[a-zA-Z][.)]|#{1,6})[ \t]+)", re.MULTILINE)
+# A sentence ends at . ! ? or a danda, also just inside a closing bold marker, but not after an abbreviation
+_ABBREVIATIONS = (r"\bDr", r"\bMr", r"\bMrs", r"\bMs", r"\bProf", r"\bSt", r"\bvs", r"e\.g", r"i\.e", r"a\.m", r"p\.m")
+_SENTENCE_END = re.compile(
+    r"((?:(?<=[.!?\u0964\u0965])|(?<=[.!?\u0964\u0965]\*\*)|(?<=[.!?\u0964\u0965]__))"
+    + "".join(rf"(?<!{a}\.)" for a in _ABBREVIATIONS)
+    + r"[ \t]+)",
+    re.IGNORECASE,
+)
+# Bold markers: a sentence wrapped in one keeps it around its translation; markers inside
+# a sentence are dropped before translation so the sentence reaches the model whole
+_BOLD_WRAPPED = re.compile(r"(\*\*|__)(?!\*|_)(.+?)\1", re.DOTALL)
+_BOLD = re.compile(r"\*\*|__")
+_CLAUSE_END = re.compile(r"(?<=[,;:])[ \t]+")
+_LETTER = re.compile(r"[^\W\d_]")
+_EDGE_LEAD = re.compile(r"[\s:;,\u2013\u2014-]*")
+
+def _split_long(sentence: str) -> List[str]:
+    words = sentence.split()
+    if len(words) <= SEGMENT_MAX_WORDS:
+        return [sentence]
+    # Prefer clause boundaries, then fall back to fixed word windows
+    parts, current = [], []
+    for clause in _CLAUSE_END.split(sentence):
+        clause_words = clause.split()
+        if current and len(current) + len(clause_words) > SEGMENT_MAX_WORDS:
+            parts.append(" ".join(current))
+            current = []
+        current.extend(clause_words)
+        while len(current) > SEGMENT_MAX_WORDS:
+            parts.append(" ".join(current[:SEGMENT_MAX_WORDS]))
+            current = current[SEGMENT_MAX_WORDS:]
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+def split_segments(text: str) -> List[tuple]:
+    """Splits text into (piece, translatable) pairs. Joining every piece gives
+    back the input, so layout (bullets, numbering, blank lines, bold around a
+    whole sentence) survives translation and no segment is long enough to be
+    truncated."""
+    pieces: List[tuple] = []
+
+    def add(piece: str, translatable: bool):
+        if piece:
+            pieces.append((piece, translatable))
+
+    def add_sentence(sentence: str):
+        for k, part in enumerate(_split_long(sentence)):
+            if k:
+                add(" ", False)
+            add(part, True)
+
+    for i, chunk in enumerate(_LAYOUT.split(text)):
+        if i % 2 == 1:
+            add(chunk, False)
+            continue
+        for j, sentence in enumerate(_SENTENCE_END.split(chunk)):
+            if j % 2 == 1 or not _LETTER.search(sentence):
+                # Separators and letter-free pieces (helpline numbers, emoji) are kept as they are
+                add(sentence, False)
+                continue
+            # Whitespace and dangling punctuation around the sentence (e.g. ": " after a bold heading) stay put
+            lead = _EDGE_LEAD.match(sentence).group()
+            stripped = sentence[len(lead):].rstrip()
+            trail = sentence[len(lead) + len(stripped):]
+            add(lead, False)
+            wrapped = _BOLD_WRAPPED.fullmatch(stripped)
+            if wrapped and not _BOLD.search(wrapped.group(2)):
+                add(wrapped.group(1), False)
+                add_sentence(wrapped.group(2))
+                add(wrapped.group(1), False)
+            else:
+                add_sentence(stripped)
+            add(trail, False)
+    return pieces
+
+class _Plan:
+    """Which segments of one text are cached and which still need the model.
+    `lookup` and `finish` do the cache's SQLite I/O; the async path runs them
+    in a worker thread."""
+
+    def __init__(self, user_input: str, direction: str, src_lang: str, tgt_lang: str, backend: str | None, profile: str | None):
+        self.backend = backend or TRANSLATION_BACKEND
+        self.profile = resolve_profile(src_lang, tgt_lang, profile)
+        self.pieces = split_segments(user_input)
+        self.direction, self.src_lang, self.tgt_lang = direction, src_lang, tgt_lang
+        self.uses_cache = TRANSLATION_CACHE and direction in CACHED_DIRECTIONS
+        self.cache: TranslationCache | None = None
+        self.sources = {i: _BOLD.sub("", piece) for i, (piece, translatable) in enumerate(self.pieces) if translatable}
+        self.keys: Dict[int, str] = {}
+        self.translated: Dict[int, str] = {}
+        self.requests: Dict[int, tuple] = {}
+
+    def lookup(self) -> "_Plan":
+        if self.uses_cache:
+            self.cache = get_translation_cache()
+            revision = f"{TRANSLATION_MODELS[self.direction]}@{TRANSLATION_MODEL_REVISION}:{self.backend}"
+            self.keys = {i: cache_key(source, self.src_lang, self.tgt_lang, revision, self.profile)
+                         for i, source in self.sources.items()}
+            cached = self.cache.get_many(self.keys.values())
+            self.translated = {i: cached[key] for i, key in self.keys.items() if key in cached}
+        self.requests = {i: _request(source, self.direction, self.src_lang, self.tgt_lang, self.backend, self.profile)
+                         for i, source in self.sources.items() if i not in self.translated}
+        return self
+
+    def finish(self, results: Dict[int, str]) -> str:
+        self.translated.update(results)
+        if self.cache:
+            self.cache.put_many({self.keys[i]: text for i, text in results.items()})
+        return "".join(self.translated.get(i, piece) for i, (piece, _) in enumerate(self.pieces))
+
+def translate(user_input: str, direction: str, src_lang: str, tgt_lang: str, backend: str | None = None,
+              profile: str | None = None) -> str:
+    plan = _Plan(user_input, direction, src_lang, tgt_lang, backend, profile).lookup()
+    futures = {i: translation_batcher.submit(request) for i, request in plan.requests.items()}
+    return plan.finish({i: future.result() for i, future in futures.items()})
+
+async def translate_async(user_input: str, direction: str, src_lang: str, tgt_lang: str, backend: str | None = None,
+                          profile: str | None = None) -> str:
+    plan = _Plan(user_input, direction, src_lang, tgt_lang, backend, profile)
+    # Cache reads and writes (and opening the cache file the first time) stay off the event loop
+    if plan.uses_cache:
+        await asyncio.to_thread(plan.lookup)
+    else:
+        plan.lookup()
+    indices = list(plan.requests)
+    results = dict(zip(indices, await asyncio.gather(*(translation_batcher.asubmit(plan.requests[i]) for i in indices))))
+    if plan.cache:
+        return await asyncio.to_thread(plan.finish, results)
+    return plan.finish(results)
+
+def cache_stats() -> dict:
+    # Reports nothing until the cache has been opened by a translation
+    return _translation_cache.stats() if _translation_cache else {}